@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Per-stage deadlines (seconds)
+DDG_TIMEOUT = float(os.environ.get("DDG_TIMEOUT", "5"))
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "30"))
+
+# Optional head start for the quick backend before the slow one is started. With the
+# default of 0 both start at once; a small delay trades a little tail latency for not
+# spending Gemini quota on questions DuckDuckGo answers quickly.
+GEMINI_HEDGE_DELAY = float(os.environ.get("GEMINI_HEDGE_DELAY", "0"))
+
+# Each general question holds up to two workers: DuckDuckGo and Gemini. A Gemini call that
+# loses to DuckDuckGo stops at its next streamed chunk, so it holds a worker for about the
+# time to the first chunk, not for the whole answer (up to GEMINI_TIMEOUT).
+ANSWER_WORKERS = int(os.environ.get("ANSWER_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=ANSWER_WORKERS, thread_name_prefix="answer")
+
+# Questions from batch requests answered at once. Each holds up to two answer workers
+# (DuckDuckGo and Gemini) while it waits. Those come from a pool of their own, so a
+# large batch never takes workers away from interactive requests.
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(max(1, ANSWER_WORKERS // 2))))
+
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+_batch_answer_executor = ThreadPoolExecutor(max_workers=2 * BATCH_WORKERS, thread_name_prefix="batch-answer")
+
+
+class Cancelled(Exception):
+    pass
+
+
+def first_good_answer(quick, slow, is_good, quick_timeout=DDG_TIMEOUT,
+                      slow_timeout=GEMINI_TIMEOUT, slow_delay=GEMINI_HEDGE_DELAY, batch=False):
+    """
+    Runs `quick()` and `slow(cancelled)` concurrently and returns (name, answer),
+    where name is "quick" or "slow".
+
+    The quick answer wins as soon as it arrives and passes `is_good`; the slow
+    call is then cancelled: dropped if it hasn't started, and told through the
+    `cancelled` Event otherwise. If the quick backend misses, errors or runs past
+    its deadline, the slow answer is returned, bounded by its own deadline
+    measured from the start. Exceptions from `slow` propagate. With `batch`, both
+    calls run on the batch answer pool instead of the interactive one.
+    """
+    started = time.monotonic()
+    cancelled = threading.Event()
+
+    def run_slow():
+        if slow_delay and cancelled.wait(slow_delay):
+            raise Cancelled()
+        if cancelled.is_set():
+            raise Cancelled()
+        return slow(cancelled)
+
+    executor = _batch_answer_executor if batch else _executor
+    quick_future = executor.submit(quick)
+    slow_future = executor.submit(run_slow)
+
+    try:
+        answer = quick_future.result(timeout=quick_timeout)
+        if is_good(answer):
+            cancelled.set()
+            slow_future.cancel()
+            return "quick", answer
+    except FutureTimeout:
+        logging.warning("Quick answer missed its %.1fs deadline", quick_timeout)
+        quick_future.cancel()
+    except Exception as e:
+        logging.warning("Quick answer failed: %s", e)
+
+    remaining = slow_timeout - (time.monotonic() - started)
+    try:
+        return "slow", slow_future.result(timeout=max(remaining, 0))
+    except FutureTimeout:
+        cancelled.set()
+        raise TimeoutError(f"No answer within {slow_timeout:.0f}s")
+
+
+_DONE = object()
+
+
+def first_good_stream(quick, slow, is_good, quick_timeout=DDG_TIMEOUT,
+                      slow_timeout=GEMINI_TIMEOUT, slow_delay=GEMINI_HEDGE_DELAY):
+    """
+    Streaming form of first_good_answer: `slow(cancelled)` returns an iterable
+    of text chunks, and this yields ("quick", answer) once or ("slow", chunk)
+    per chunk. The slow stream starts alongside the quick call and is buffered
+    until the quick answer has been judged, so it doesn't lose time waiting.
+    Each chunk must arrive within `slow_timeout` of the start, otherwise
+    TimeoutError is raised. Closing the generator cancels the slow stream.
+    """
+    started = time.monotonic()
+    cancelled = threading.Event()
+    chunks = queue.Queue()
+
+    def produce():
+        try:
+            if slow_delay and cancelled.wait(slow_delay):
+                return
+            for chunk in slow(cancelled):
+                if cancelled.is_set():
+                    return
+                chunks.put(chunk)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(_DONE)
+
+    quick_future = _executor.submit(quick)
+    _executor.submit(produce)
+
+    try:
+        try:
+            answer = quick_future.result(timeout=quick_timeout)
+            if is_good(answer):
+                cancelled.set()
+                yield "quick", answer
+                return
+        except FutureTimeout:
+            logging.warning("Quick answer missed its %.1fs deadline", quick_timeout)
+            quick_future.cancel()
+        except Exception as e:
+            logging.warning("Quick answer failed: %s", e)
+
+        while True:
+            remaining = slow_timeout - (time.monotonic() - started)
+            try:
+                chunk = chunks.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise TimeoutError(f"No answer within {slow_timeout:.0f}s")
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield "slow", chunk
+    finally:
+        cancelled.set()
+
+
+def map_concurrently(func, items) -> list:
+    """
+    Calls func(item) for every item on the bounded batch pool. Returns one
+    (result, error) pair per item, in order; error is None on success.
+    """
+    futures = [_batch_executor.submit(func, item) for item in items]
+    outcomes = []
+    for future in futures:
+        try:
+            outcomes.append((future.result(), None))
+        except Exception as e:
+            logging.debug("Batch item failed: %s", e)
+            outcomes.append((None, e))
+    return outcomes
@@ -1,39 +1,50 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Blueprint, render_template, request, jsonify, session, Response, stream_with_context, g
 import os
+import json
+import time
+import uuid
 from dotenv import load_dotenv
-from search import search_with_gemini, is_browser_history_query, fetch_brave_history, search_duckduckgo, chat_memory
+from search import search_with_gemini, stream_with_gemini, search_batch, is_browser_history_query, answer_history_query, search_duckduckgo, detect_intent_and_entities, fetch_history_page, iter_history, HISTORY_PAGE_SIZE
+from response_cache import response_cache
+from conversation_store import conversation_store
+from nlp_pipeline import warm_up, is_ready
+from metrics import registry, span, request_seconds, requests_total
 import logging
 
 
 
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+bp = Blueprint("chat", __name__)
 
 # Global variable for history access
 history_access_enabled = False
 
+def conversation_id() -> str:
+    """
+    The id that keys this browser session's conversation history, assigned on first use.
+    """
+    if 'conversation_id' not in session:
+        session['conversation_id'] = uuid.uuid4().hex
+    return session['conversation_id']
+
 # routes
 
-@app.route("/")
+@bp.route("/")
 def main():
     return render_template("index.html")
 
-@app.route('/search', methods=['POST'])
+@bp.route('/search', methods=['POST'])
 def search():
     data = request.get_json()
     query = data.get('query', '').strip()
-    history_access= data.get('historyAccess', False)  # Check if history access is enabled
-
-    # Update session with the history access status
-    session['history_access_enabled'] = history_access_enabled
-    logging.debug(f"Request JSON: {data}")
-    logging.debug(f"History access enabled: {session.get('history_access_enabled')}")
+    # The toggle applies to this request only; it never grants the session history access
+    history_access = data.get('historyAccess') is True
+    logging.debug("History access enabled: %s", history_access)
 
     # Check if the query is related to browser history
-    if is_browser_history_query(query):
-        if not session.get('history_access_enabled', False):
+    if is_browser_history_query(query, history_access):
+        if not history_access:
             # Prompt the user to enable history access or proceed with a normal response
             return jsonify({
                 "response": "History access is disabled. Would you like to enable it or proceed with a normal response?",
@@ -41,14 +52,114 @@ def search():
             })
 
         # If history access is enabled, fetch the browser history
-        history_response = fetch_brave_history()
-        return jsonify({"response": history_response})
+        history_response = answer_history_query(query)
+        with span("format"):
+            return jsonify({"response": history_response})
 
     # Handle normal queries
-    response = search_with_gemini(query, chat_memory)
-    return jsonify({"response": response})
-
-@app.route('/privacy', methods=['POST'])
+    response = search_with_gemini(query, conversation_id(), history_access)
+    with span("format"):
+        return jsonify({"response": response})
+
+@bp.route('/search/batch', methods=['POST'])
+def batch_search():
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({"error": "Expected a JSON object with a list of query strings in \"queries\"."}), 400
+
+    # Batch questions are independent of the chat, so they neither read nor extend the
+    # conversation, and their history flag applies to this request only
+    try:
+        results = search_batch(queries, history_access=data.get('historyAccess') is True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with span("format"):
+        return jsonify({"results": results})
+
+def sse_event(data: dict, event: str = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@bp.route('/search/stream', methods=['POST'])
+def search_stream():
+    data = request.get_json()
+    query = data.get('query', '').strip()
+    history_access = data.get('historyAccess') is True
+    session_id = conversation_id()
+
+    # Server-Sent Events: one "data" event per chunk of the answer, then "done"
+    def generate():
+        if is_browser_history_query(query, history_access):
+            chunks = [answer_history_query(query)]
+        else:
+            chunks = stream_with_gemini(query, session_id, history_access)
+        for chunk in chunks:
+            with span("format"):
+                event = sse_event({"text": chunk})
+            yield event
+        yield sse_event({}, event="done")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def history_filters():
+    """
+    Reads the history query from the request args and turns it into keyword/date filters.
+    Consent comes from POST /enable-history or /privacy, never from a GET.
+    """
+    query = request.args.get('query', '').strip()
+    if not query:
+        return None, None
+    _, entities = detect_intent_and_entities(query)
+    return entities.get("keywords"), entities.get("date_range")
+
+@bp.route('/history', methods=['GET'])
+def history():
+    keywords, date = history_filters()
+    if not session.get('history_access_enabled', False):
+        return jsonify({"error": "History access is disabled."}), 403
+
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 500))
+    try:
+        page = fetch_history_page(
+            keyword=keywords, date=date, cursor=request.args.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+@bp.route('/history/stream', methods=['GET'])
+def history_stream():
+    keywords, date = history_filters()
+    if not session.get('history_access_enabled', False):
+        return jsonify({"error": "History access is disabled."}), 403
+
+    # One JSON object per line, produced page by page as the client reads
+    def generate():
+        try:
+            for entry in iter_history(keyword=keywords, date=date):
+                yield json.dumps(entry) + "\n"
+        except Exception as e:
+            logging.error("Error streaming browser history: %s", e)
+            yield json.dumps({"error": f"Error fetching browser history: {e}"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@bp.route('/conversation', methods=['DELETE'])
+def clear_conversation():
+    conversation_store.clear(conversation_id())
+    return jsonify({"response": "Conversation cleared."})
+
+@bp.route('/privacy', methods=['POST'])
 def privacy():
     data = request.get_json()
     option = data.get('option')
@@ -64,10 +175,51 @@ def privacy():
         logging.warning("Invalid option selected.")
         return jsonify({"response": "Invalid option selected."})
 
-@app.route('/enable-history', methods=['POST'])
+@bp.route('/enable-history', methods=['POST'])
 def enable_history():
     session['history_access_enabled'] = True  # Enable history access for the session
     return jsonify({"response": "History access has been enabled."})
 
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+@bp.before_app_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@bp.after_app_request
+def record_request(response):
+    # Streaming endpoints are timed to their first byte; their stages are timed separately
+    endpoint = request.endpoint or "unknown"
+    if 'started' in g:
+        request_seconds.observe(time.perf_counter() - g.started, endpoint=endpoint)
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving requests
+    return jsonify({"status": "ok"})
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: the spaCy pipeline has finished loading
+    if not is_ready():
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready"})
+
+def create_app(preload: bool = False) -> Flask:
+    """
+    Builds the Flask app. With preload the spaCy pipeline is loaded before
+    returning, so a preforking server can load it once in the master process
+    and share it with every worker; otherwise it loads in the background.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+    app.register_blueprint(bp)
+    warm_up(background=not preload)
+    return app
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Writes a synthetic Chromium-schema `History` database for benchmarking.
+
+    python benchmarks/generate_history.py /tmp/bench/History --visits 1000000
+
+Domain and page popularity follow Zipf-like distributions, visits cluster in
+waking hours, and link visits chain to the visit before them, so the data
+exercises the same skew as a real profile.
+"""
+import os
+import sqlite3
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+WEBKIT_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+# Chromium page transition core types
+TRANSITION_LINK = 0
+TRANSITION_TYPED = 1
+TRANSITION_RELOAD = 8
+
+# Zipf exponents for domain popularity and for page popularity within a domain
+DOMAIN_SKEW = 1.1
+PAGE_SKEW = 1.2
+
+# Relative browsing activity for each hour of the day (local time)
+HOURLY_ACTIVITY = np.array(
+    [2, 1, 1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 9, 10, 10, 9, 9, 8, 8, 9, 10, 9, 6, 4], dtype=float
+)
+
+INSERT_BATCH_SIZE = 50000
+
+DAY = 86400 * 1000000
+
+POPULAR_DOMAINS = [
+    "google.com", "youtube.com", "github.com", "stackoverflow.com", "wikipedia.org",
+    "reddit.com", "twitter.com", "linkedin.com", "amazon.com", "netflix.com",
+    "docs.python.org", "developer.mozilla.org", "medium.com", "news.ycombinator.com",
+    "nytimes.com", "bbc.co.uk", "spotify.com", "mail.google.com", "drive.google.com",
+    "chatgpt.com", "instagram.com", "facebook.com", "twitch.tv", "arxiv.org", "kaggle.com",
+]
+
+WORDS = (
+    "python flask sqlite spacy numpy pandas rust golang java kotlin react vue docker "
+    "kubernetes linux git regex async thread cache index query join tutorial guide "
+    "install error fix release news weather football cricket recipe pasta curry travel "
+    "flights hotel budget laptop phone camera review price music playlist movie series "
+    "trailer science space physics chemistry biology history economics market stock "
+    "crypto bitcoin design figma icons fonts color learning course lecture notes paper "
+    "research dataset model training benchmark performance memory latency profile"
+).split()
+
+SCHEMA = """
+CREATE TABLE meta (key LONGVARCHAR NOT NULL UNIQUE PRIMARY KEY, value LONGVARCHAR);
+CREATE TABLE urls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url LONGVARCHAR,
+    title LONGVARCHAR,
+    visit_count INTEGER DEFAULT 0 NOT NULL,
+    typed_count INTEGER DEFAULT 0 NOT NULL,
+    last_visit_time INTEGER NOT NULL,
+    hidden INTEGER DEFAULT 0 NOT NULL
+);
+CREATE TABLE visits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url INTEGER NOT NULL,
+    visit_time INTEGER NOT NULL,
+    from_visit INTEGER,
+    transition INTEGER DEFAULT 0 NOT NULL,
+    segment_id INTEGER,
+    visit_duration INTEGER DEFAULT 0 NOT NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX urls_url_index ON urls (url);
+CREATE INDEX visits_url_index ON visits (url);
+CREATE INDEX visits_time_index ON visits (visit_time);
+"""
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def make_domains(n: int, rng) -> list:
+    domains = POPULAR_DOMAINS[:n]
+    tlds = ["com", "org", "net", "io", "dev", "co.uk", "in"]
+    while len(domains) < n:
+        domains.append(f"{rng.choice(WORDS)}{len(domains)}.{rng.choice(tlds)}")
+    return domains
+
+
+def make_page(domain: str, rank: int, rng):
+    """
+    Returns (url, title) for the rank-th page of a domain.
+    """
+    words = list(rng.choice(WORDS, size=3, replace=False))
+    if rank == 0:
+        return f"https://{domain}/", domain.split(".")[0].capitalize()
+    if domain == "google.com":
+        return f"https://www.google.com/search?q={'+'.join(words)}", f"{' '.join(words)} - Google Search"
+    path = f"/{words[0]}/{words[1]}-{words[2]}-{rank}"
+    return f"https://{domain}{path}", f"{words[1].capitalize()} {words[2]} {words[0]} – {domain}"
+
+
+def generate(path: str, visits: int = 100000, days: int = 90, seed: int = 0, now: datetime = None):
+    """
+    Writes a History database with about `visits` visits spread over the last `days`
+    days, today included. Visits that would fall after `now` are dropped.
+    """
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now(timezone.utc)
+    end_time = (now - WEBKIT_EPOCH) // timedelta(microseconds=1)
+
+    n_urls = max(100, visits // 6)
+    n_domains = max(len(POPULAR_DOMAINS), n_urls // 40)
+
+    # Each url belongs to a domain drawn by popularity; its weight is the domain's
+    # weight scaled by its rank among that domain's pages
+    domain_weights = zipf_weights(n_domains, DOMAIN_SKEW)
+    url_domains = rng.choice(n_domains, size=n_urls, p=domain_weights)
+    order = np.argsort(url_domains, kind="stable")
+    page_rank = np.empty(n_urls, dtype=np.int64)
+    sorted_domains = url_domains[order]
+    starts = np.searchsorted(sorted_domains, sorted_domains, side="left")
+    page_rank[order] = np.arange(n_urls) - starts
+    url_weights = domain_weights[url_domains] / (page_rank + 1.0) ** PAGE_SKEW
+    url_weights /= url_weights.sum()
+
+    # Visits: url by popularity, day uniformly, hour by the daily activity curve.
+    # Days start at (UTC) midnight so the hour really is the hour of day.
+    visit_urls = rng.choice(n_urls, size=visits, p=url_weights)
+    day = rng.integers(0, days, size=visits)
+    hour = rng.choice(24, size=visits, p=HOURLY_ACTIVITY / HOURLY_ACTIVITY.sum())
+    offset = rng.integers(0, 3600 * 1000000, size=visits)
+    midnight = end_time - end_time % DAY
+    visit_times = midnight - (days - 1 - day) * DAY + hour * 3600 * 1000000 + offset
+    past = visit_times <= end_time
+    visit_urls, visit_times = visit_urls[past], visit_times[past]
+    visits = len(visit_times)
+    order = np.argsort(visit_times, kind="stable")
+    visit_urls, visit_times = visit_urls[order], visit_times[order]
+
+    # Link visits within 10 minutes of the previous visit were reached from it
+    transitions = rng.choice(
+        [TRANSITION_LINK, TRANSITION_TYPED, TRANSITION_RELOAD], size=visits, p=[0.8, 0.15, 0.05]
+    )
+    visit_ids = np.arange(1, visits + 1)
+    gaps = np.diff(visit_times, prepend=visit_times[0] - 10 ** 12)
+    from_visit = np.where((transitions == TRANSITION_LINK) & (gaps < 600 * 1000000), visit_ids - 1, 0)
+    durations = np.where(
+        rng.random(visits) < 0.3, 0, rng.lognormal(17, 1.5, size=visits).astype(np.int64)
+    )
+
+    visit_counts = np.bincount(visit_urls, minlength=n_urls)
+    typed_counts = np.bincount(visit_urls[transitions == TRANSITION_TYPED], minlength=n_urls)
+    last_visit = np.zeros(n_urls, dtype=np.int64)
+    np.maximum.at(last_visit, visit_urls, visit_times)
+    last_visit[visit_counts == 0] = midnight - days * DAY
+
+    domains = make_domains(n_domains, rng)
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO meta (key, value) VALUES ('version', '67')")
+
+    with conn:
+        for start in range(0, n_urls, INSERT_BATCH_SIZE):
+            rows = []
+            for i in range(start, min(start + INSERT_BATCH_SIZE, n_urls)):
+                url, title = make_page(domains[url_domains[i]], int(page_rank[i]), rng)
+                rows.append((i + 1, url, title, int(visit_counts[i]), int(typed_counts[i]), int(last_visit[i])))
+            conn.executemany(
+                "INSERT INTO urls (id, url, title, visit_count, typed_count, last_visit_time) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+        for start in range(0, visits, INSERT_BATCH_SIZE):
+            stop = min(start + INSERT_BATCH_SIZE, visits)
+            conn.executemany(
+                "INSERT INTO visits (id, url, visit_time, from_visit, transition, visit_duration) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                zip(
+                    visit_ids[start:stop].tolist(),
+                    (visit_urls[start:stop] + 1).tolist(),
+                    visit_times[start:stop].tolist(),
+                    from_visit[start:stop].tolist(),
+                    transitions[start:stop].tolist(),
+                    durations[start:stop].tolist(),
+                ),
+            )
+
+    conn.executescript(INDEXES)
+    conn.close()
+    return {"urls": n_urls, "domains": n_domains, "visits": visits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="Where to write the History database")
+    parser.add_argument("--visits", type=int, default=100000, help="Number of visits to draw (10k to 10M); any later than now are dropped")
+    parser.add_argument("--days", type=int, default=90, help="Days of history to spread visits over")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate(args.path, visits=args.visits, days=args.days, seed=args.seed)
+    print(f"Wrote {counts['visits']:,} visits to {counts['urls']:,} urls on {counts['domains']:,} domains: {args.path}")
+
+
+if __name__ == "__main__":
+    main()
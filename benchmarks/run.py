@@ -0,0 +1,219 @@
+"""
+Microbenchmarks for the history and query-analysis paths.
+
+    python benchmarks/run.py --visits 100000
+    python benchmarks/run.py --visits 100000 --compare benchmarks/results/<older>.json
+
+Each run generates (or reuses) a synthetic History database, times every
+benchmark and writes the results, tagged with the git commit, as JSON.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+QUERIES = [
+    "what is python", "explain how transformers work in detail", "compare rust vs go",
+    "show me my browser history from yesterday", "what did I visit last week about flask",
+    "top domains last month", "which sites did I spend most time on this week",
+    "I'm so frustrated with this bug, help", "give me an example of a closure",
+    "tell me more", "history of the roman empire", "pages about numpy between March 3 and 10",
+    "what was I reading on Tuesday afternoon", "how does sqlite fts5 ranking work",
+    "visits per hour today", "recipe for pasta", "I love this, go deeper",
+]
+
+HISTORY_CASES = {
+    "fetch_brave_history.all": {},
+    "fetch_brave_history.keyword": {"keyword": ["python", "tutorial"]},
+    "fetch_brave_history.date": {"date": "last week"},
+    "fetch_brave_history.keyword_date": {"keyword": ["flask"], "date": "last month"},
+}
+
+SEMANTIC_QUERIES = ["rust async article", "python flask tutorial", "docker on github", "pasta recipe", "space physics"]
+
+
+def git_sha() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(func, repeat: int, warmup: int = 1) -> dict:
+    """
+    Calls func() `repeat` times after `warmup` untimed calls; returns timings in milliseconds.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        "n": repeat,
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "min_ms": round(samples[0], 4),
+        "p50_ms": round(percentile(50), 4),
+        "p95_ms": round(percentile(95), 4),
+        "p99_ms": round(percentile(99), 4),
+    }
+
+
+def cycle(items):
+    """
+    Returns a zero-argument function yielding successive items forever.
+    """
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+    return next_item
+
+
+def run(visits: int, repeat: int, history_path: str = None, keep: bool = False) -> dict:
+    workdir = tempfile.mkdtemp(prefix="ddc-bench-")
+    # The store directory and model stand-in must be set before the app modules are imported
+    os.environ["HISTORY_STORE_DIR"] = os.path.join(workdir, "store")
+    os.environ.setdefault("GEMINI_FAKE_MODEL", "1")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, ROOT)
+
+    from benchmarks.generate_history import generate
+
+    if history_path is None:
+        history_path = os.path.join(workdir, "Brave", "Default", "History")
+        started = time.perf_counter()
+        generate(history_path, visits=visits)
+        print(f"generated {visits:,} visits in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    import search
+    import nlp_pipeline
+    import prompt_builder
+    from history_engine import HistoryEngine
+    from history_sources import ChromiumSource
+
+    results = {}
+    try:
+        # Point the history path at the synthetic profile only
+        search.history_engine = HistoryEngine(sources=[ChromiumSource("Brave", "Default", history_path)])
+
+        started = time.perf_counter()
+        search.history_engine.stores()
+        results["history_store.initial_sync"] = {"n": 1, "mean_ms": round((time.perf_counter() - started) * 1000, 4)}
+
+        for name, kwargs in HISTORY_CASES.items():
+            results[name] = measure(lambda: search.fetch_brave_history(**kwargs), repeat)
+
+        started = time.perf_counter()
+        search.history_engine.semantic_search(SEMANTIC_QUERIES[0])
+        results["semantic_index.build"] = {"n": 1, "mean_ms": round((time.perf_counter() - started) * 1000, 4)}
+        next_semantic = cycle(SEMANTIC_QUERIES)
+        results["semantic_search"] = measure(lambda: search.history_engine.semantic_search(next_semantic()), repeat)
+
+        nlp_pipeline.get_nlp()
+        next_query = cycle(QUERIES)
+
+        def cold_analysis():
+            nlp_pipeline._cache.clear()
+            search.detect_intent_and_entities(next_query())
+
+        results["detect_intent_and_entities.cold"] = measure(cold_analysis, repeat)
+        for query in QUERIES:
+            search.detect_intent_and_entities(query)
+        results["detect_intent_and_entities.cached"] = measure(
+            lambda: search.detect_intent_and_entities(next_query()), repeat
+        )
+
+        # Distinct strings each time, so the matcher's memo cache doesn't hide the matching cost
+        counter = cycle(range(10 ** 9))
+        results["detect_intent"] = measure(lambda: search.detect_intent(f"{next_query()} {counter()}"), repeat)
+        results["detect_sentiment"] = measure(lambda: search.detect_sentiment(f"{next_query()} {counter()}"), repeat)
+
+        history = [
+            {"user_input": query, "bot_response": "A fairly long answer. " * 60} for query in QUERIES
+        ]
+        summary = ""
+        for i in range(len(history)):
+            summary = prompt_builder.fold_summary(summary, history[:i])
+        results["build_prompt"] = measure(
+            lambda: prompt_builder.build_prompt(next_query(), history, summary, "friendly", "explore", False),
+            repeat,
+        )
+    finally:
+        if keep:
+            print(f"kept {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "git_sha": git_sha(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "visits": visits,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict):
+    print(f"baseline {baseline['git_sha'][:12]} ({baseline['visits']:,} visits), "
+          f"current {current['git_sha'][:12]} ({current['visits']:,} visits)")
+    print(f"{'benchmark':40} {'baseline p50':>14} {'current p50':>14} {'change':>9}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        key = "p50_ms" if "p50_ms" in result else "mean_ms"
+        if not before or key not in before:
+            continue
+        change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{name:40} {before[key]:>12.3f}ms {result[key]:>12.3f}ms {change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--visits", type=int, default=100000, help="Size of the synthetic history (10k to 10M)")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed calls per benchmark")
+    parser.add_argument("--history", help="Use an existing History database instead of generating one")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<sha>-<visits>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated database and store")
+    args = parser.parse_args()
+
+    report = run(args.visits, args.repeat, history_path=args.history, keep=args.keep)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['git_sha'][:12]}-{args.visits}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    else:
+        json.dump(report["results"], sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
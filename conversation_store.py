@@ -0,0 +1,223 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+from metrics import registry, Gauge
+
+# Turns of context kept per conversation
+MAX_TURNS = int(os.environ.get("CONVERSATION_MAX_TURNS", "20"))
+
+# Conversations untouched for this many seconds are dropped
+IDLE_TTL = float(os.environ.get("CONVERSATION_IDLE_TTL", str(60 * 60)))
+
+# Upper bound on conversations held in process; the least recently used go first
+MAX_SESSIONS = int(os.environ.get("CONVERSATION_MAX_SESSIONS", "10000"))
+
+# SQLite file shared by worker processes; unset to keep conversations in process
+CONVERSATION_STORE_PATH = os.environ.get("CONVERSATION_STORE_PATH")
+
+# Idle SQLite conversations are purged every this many appends
+PURGE_INTERVAL = 200
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_input TEXT NOT NULL,
+    bot_response TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session_id ON turns(session_id, id);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL,
+    summary TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions(last_seen);
+"""
+
+
+class MemoryConversationStore:
+    """
+    Conversations in this process: a bounded deque of turns and a rolling
+    summary per session id, in an LRU-ordered dict. Idle and excess
+    conversations are evicted on access.
+    """
+
+    def __init__(self, max_turns=MAX_TURNS, idle_ttl=IDLE_TTL, max_sessions=MAX_SESSIONS):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (last_seen, deque of turns, summary)
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, (last_seen, _, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - last_seen < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+
+    def context(self, session_id: str):
+        """
+        Returns (summary, turns): the rolling summary and a copy of the session's
+        turns, oldest first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            return (entry[2], list(entry[1])) if entry else ("", [])
+
+    def append(self, session_id: str, user_input: str, bot_response: str, summary: str = None):
+        """
+        Adds a turn, and replaces the rolling summary when one is given.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            turns = entry[1] if entry else deque(maxlen=self.max_turns)
+            turns.append({"user_input": user_input, "bot_response": bot_response})
+            if summary is None:
+                summary = entry[2] if entry else ""
+            self._sessions[session_id] = (now, turns, summary)
+            self._evict(now)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "turns": sum(len(turns) for _, turns, _ in self._sessions.values()),
+            }
+
+
+class SQLiteConversationStore:
+    """
+    Conversations in a SQLite file, so every worker process sees the same
+    history for a session. Each session keeps at most max_turns rows.
+    """
+
+    def __init__(self, path: str, max_turns=MAX_TURNS, idle_ttl=IDLE_TTL):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect()
+        # Conversations are short-lived, so an older layout is simply recreated
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.executescript("DROP TABLE IF EXISTS turns; DROP TABLE IF EXISTS sessions;")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._lock = threading.Lock()
+        self._appends = 0
+        # SQLite connections must not cross fork(); preforked workers each open their own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._connect()
+
+    def context(self, session_id: str):
+        with self._lock:
+            session = self._conn.execute(
+                "SELECT summary FROM sessions WHERE session_id = ? AND last_seen > ?",
+                (session_id, time.time() - self.idle_ttl),
+            ).fetchone()
+            if session is None:
+                return "", []
+            rows = self._conn.execute(
+                "SELECT user_input, bot_response FROM turns WHERE session_id = ? ORDER BY id",
+                (session_id,),
+            ).fetchall()
+        turns = [{"user_input": user_input, "bot_response": bot_response} for user_input, bot_response in rows]
+        return session[0], turns
+
+    def append(self, session_id: str, user_input: str, bot_response: str, summary: str = None):
+        now = time.time()
+        with self._lock, self._conn:
+            # A conversation that went idle starts over rather than resuming stale context
+            self._conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND EXISTS "
+                "(SELECT 1 FROM sessions WHERE session_id = ? AND last_seen <= ?)",
+                (session_id, session_id, now - self.idle_ttl),
+            )
+            self._conn.execute(
+                "UPDATE sessions SET summary = '' WHERE session_id = ? AND last_seen <= ?",
+                (session_id, now - self.idle_ttl),
+            )
+            self._conn.execute(
+                "INSERT INTO turns (session_id, user_input, bot_response) VALUES (?, ?, ?)",
+                (session_id, user_input, bot_response),
+            )
+            self._conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns),
+            )
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, last_seen, summary) VALUES (?, ?, COALESCE(?, '')) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_seen = excluded.last_seen, "
+                "summary = COALESCE(?, summary)",
+                (session_id, now, summary, summary),
+            )
+            self._appends += 1
+            if self._appends % PURGE_INTERVAL == 0:
+                self._purge(now)
+
+    def _purge(self, now: float):
+        cutoff = now - self.idle_ttl
+        self._conn.execute(
+            "DELETE FROM turns WHERE session_id IN (SELECT session_id FROM sessions WHERE last_seen <= ?)",
+            (cutoff,),
+        )
+        self._conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (cutoff,))
+
+    def clear(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions, = self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_seen > ?", (time.time() - self.idle_ttl,)
+            ).fetchone()
+            turns, = self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()
+        return {"backend": "sqlite", "sessions": sessions, "turns": turns}
+
+
+def make_conversation_store(path=CONVERSATION_STORE_PATH):
+    """
+    SQLite-backed when a path is configured, otherwise in process.
+    """
+    if path:
+        return SQLiteConversationStore(path)
+    return MemoryConversationStore()
+
+
+# Shared by every request in the process
+conversation_store = make_conversation_store()
+
+
+def _conversation_counts() -> dict:
+    stats = conversation_store.stats()
+    return {(stats["backend"], kind): stats[kind] for kind in ("sessions", "turns")}
+
+
+registry.register(Gauge(
+    "chatbot_conversations", "Live conversations and the turns they hold, from the conversation store.",
+    ["backend", "kind"], _conversation_counts,
+))
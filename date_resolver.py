@@ -0,0 +1,307 @@
+import re
+import calendar
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from history_store import datetime_to_webkit
+
+# A half-open [start, end) interval in local time
+DateRange = namedtuple("DateRange", ["start", "end"])
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTH_ABBREVIATIONS = {name.lower(): number for number, name in enumerate(calendar.month_abbr) if name}
+MONTH_ABBREVIATIONS["sept"] = 9
+WEEKDAYS = {name.lower(): number for number, name in enumerate(calendar.day_name)}
+
+# Hours covered by each part of the day; night runs past midnight
+PARTS_OF_DAY = {
+    "morning": (5, 12),
+    "afternoon": (12, 17),
+    "evening": (17, 21),
+    "night": (21, 29),
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "couple of": 2, "few": 3,
+}
+
+UNITS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+
+# Words that only ever express time; callers drop them from search keywords
+DATE_WORDS = (
+    set(MONTHS) | set(WEEKDAYS) | set(PARTS_OF_DAY)
+    | {unit + suffix for unit in ("minute", "hour", "day", "week", "weekend", "month", "year") for suffix in ("", "s")}
+    | {"today", "yesterday", "tonight", "ago", "between", "since"}
+)
+
+
+def _alternation(words) -> str:
+    return "|".join(sorted((re.escape(word) for word in words), key=len, reverse=True))
+
+
+_MONTH = f"(?P<month>{_alternation(list(MONTHS) + list(MONTH_ABBREVIATIONS))})"
+_DAY = r"(?P<day>\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s+(?P<year>\d{4}))?"
+_WEEKDAY = f"(?P<weekday>{_alternation(WEEKDAYS)})"
+_PART = f"(?:\\s+(?:in\\s+the\\s+)?(?P<part>{_alternation(PARTS_OF_DAY)}))?"
+_COUNT = f"(?P<count>\\d+|{_alternation(NUMBER_WORDS)})"
+_UNIT = r"(?P<unit>minute|hour|day|week|month|year)s?"
+
+
+# --- Calendar helpers ---
+def _midnight(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _day(value: datetime, part=None) -> DateRange:
+    start = _midnight(value)
+    if part:
+        first, last = PARTS_OF_DAY[part]
+        return DateRange(start + timedelta(hours=first), start + timedelta(hours=last))
+    return DateRange(start, start + timedelta(days=1))
+
+
+def _week(value: datetime) -> DateRange:
+    start = _midnight(value) - timedelta(days=value.weekday())
+    return DateRange(start, start + timedelta(weeks=1))
+
+
+def _month(year: int, month: int) -> DateRange:
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return DateRange(start, end)
+
+
+def _shift_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    day = min(value.day, calendar.monthrange(year, month + 1)[1])
+    return value.replace(year=year, month=month + 1, day=day)
+
+
+def _count(match) -> int:
+    count = match.group("count")
+    return int(count) if count.isdigit() else NUMBER_WORDS[count]
+
+
+def _month_number(name: str) -> int:
+    return MONTHS.get(name) or MONTH_ABBREVIATIONS[name]
+
+
+def _past_date(now: datetime, month: int, day: int, year=None) -> datetime:
+    """
+    A month/day without a year means its most recent occurrence, since history lies in the past.
+    """
+    if year:
+        return datetime(int(year), month, day)
+    candidate = datetime(now.year, month, day)
+    return candidate if candidate <= now else datetime(now.year - 1, month, day)
+
+
+# --- Expression handlers: (match, now) -> DateRange ---
+def _iso_date(match, now):
+    return _day(datetime(int(match.group("year")), int(match.group("month")), int(match.group("day"))))
+
+
+def _month_day(match, now):
+    month = _month_number(match.group("month"))
+    return _day(_past_date(now, month, int(match.group("day")), match.group("year")))
+
+
+def _rolling(match, now):
+    # "last 3 days", "past 2 hours", "past week": a window ending now
+    count = _count(match) if match.groupdict().get("count") else 1
+    unit = match.group("unit")
+    if unit == "month":
+        return DateRange(_shift_months(now, -count), now)
+    if unit == "year":
+        return DateRange(now.replace(year=now.year - count), now)
+    return DateRange(now - count * UNITS[unit], now)
+
+
+def _ago(match, now):
+    # "3 days ago" is that day; "2 weeks ago" is that week
+    count = _count(match)
+    unit = match.group("unit")
+    if unit == "month":
+        then = _shift_months(now, -count)
+        return _month(then.year, then.month)
+    if unit == "year":
+        return DateRange(datetime(now.year - count, 1, 1), datetime(now.year - count + 1, 1, 1))
+    if unit == "week":
+        return _week(now - count * UNITS["week"])
+    if unit == "day":
+        return _day(now - count * UNITS["day"])
+    return DateRange(now - count * UNITS[unit], now - (count - 1) * UNITS[unit])
+
+
+def _calendar_period(match, now):
+    # "last week" / "this month" are calendar periods, not rolling windows
+    previous = match.group("which") in ("last", "previous")
+    unit = match.group("unit")
+    if unit == "week":
+        return _week(now - timedelta(weeks=1) if previous else now)
+    if unit == "weekend":
+        saturday = _midnight(now) - timedelta(days=(now.weekday() - 5) % 7)
+        if previous and now.weekday() >= 5:
+            saturday -= timedelta(weeks=1)
+        return DateRange(saturday, saturday + timedelta(days=2))
+    if unit == "month":
+        then = _shift_months(now, -1) if previous else now
+        return _month(then.year, then.month)
+    year = now.year - 1 if previous else now.year
+    return DateRange(datetime(year, 1, 1), datetime(year + 1, 1, 1))
+
+
+def _day_before_yesterday(match, now):
+    return _day(now - timedelta(days=2))
+
+
+def _last_night(match, now):
+    return _day(now - timedelta(days=1), "night")
+
+
+def _yesterday(match, now):
+    return _day(now - timedelta(days=1), match.group("part"))
+
+
+def _today(match, now):
+    return _day(now, match.group("part"))
+
+
+def _tonight(match, now):
+    return _day(now, "night")
+
+
+def _weekday(match, now):
+    # "Tuesday" is the most recent Tuesday (today included); "last Tuesday" is strictly before today
+    days_back = (now.weekday() - WEEKDAYS[match.group("weekday")]) % 7
+    if match.group("which") in ("last", "previous") and days_back == 0:
+        days_back = 7
+    return _day(now - timedelta(days=days_back), match.group("part"))
+
+
+def _whole_month(match, now):
+    month = _month_number(match.group("month"))
+    year = int(match.group("year")) if match.group("year") else (now.year if month <= now.month else now.year - 1)
+    return _month(year, month)
+
+
+# Tried in order; more specific expressions come first
+EXPRESSIONS = [
+    (rf"(?P<year>\d{{4}})-(?P<month>\d{{1,2}})-(?P<day>\d{{1,2}})", _iso_date),
+    (rf"{_MONTH}\.?\s+{_DAY}{_YEAR}", _month_day),
+    (rf"{_DAY}\s+(?:of\s+)?{_MONTH}{_YEAR}", _month_day),
+    (rf"(?:last|past|previous)\s+{_COUNT}\s+{_UNIT}", _rolling),
+    (rf"{_COUNT}\s+{_UNIT}\s+ago", _ago),
+    (r"(?P<which>last|previous|this|current)\s+(?P<unit>weekend|week|month|year)", _calendar_period),
+    (r"(?:last|past)\s+(?P<unit>minute|hour|day|week|month|year)", _rolling),
+    (r"(?:the\s+)?day\s+before\s+yesterday", _day_before_yesterday),
+    (r"last\s+night", _last_night),
+    (rf"yesterday{_PART}", _yesterday),
+    (rf"today{_PART}", _today),
+    (r"this\s+(?P<part>morning|afternoon|evening)", _today),
+    (r"tonight", _tonight),
+    (rf"(?:(?P<which>last|previous|this|on|past)\s+)?{_WEEKDAY}{_PART}", _weekday),
+    # "may" is usually a verb, so the month alone needs a preposition
+    (rf"(?:(?:in|during|of)\s+)?(?P<month>{_alternation(m for m in MONTHS if m != 'may')}){_YEAR}", _whole_month),
+    (rf"(?:in|during|of)\s+(?P<month>may){_YEAR}", _whole_month),
+]
+EXPRESSIONS = [(re.compile(rf"(?<!\w)(?:{pattern})(?!\w)"), handler) for pattern, handler in EXPRESSIONS]
+
+_RANGE_START = re.compile(r"(?<!\w)(?:between|from)\s+")
+_RANGE_JOIN = re.compile(r"\s*(?:and|to|until|till|through|-|–)\s*")
+_BARE_DAY = re.compile(rf"{_DAY}(?!\w)")
+_SINCE = re.compile(r"(?<!\w)since\s+")
+
+
+def _match_at(text: str, pos: int, now: datetime):
+    """
+    Resolves the expression that starts exactly at `pos`. Returns (DateRange, end position) or None.
+    """
+    for pattern, handler in EXPRESSIONS:
+        match = pattern.match(text, pos)
+        if match:
+            try:
+                return handler(match, now), match.end()
+            except (ValueError, OverflowError):
+                return None
+    return None
+
+
+def _resolve_range(text: str, now: datetime):
+    # "between March 3 and 5", "from last Monday to Wednesday", "since yesterday"
+    for start_match in _RANGE_START.finditer(text):
+        first = _match_at(text, start_match.end(), now)
+        if not first:
+            continue
+        first_range, pos = first
+        join = _RANGE_JOIN.match(text, pos)
+        if not join:
+            continue
+
+        second = _match_at(text, join.end(), now)
+        if second:
+            second_range = second[0]
+        else:
+            # A bare day number inherits the month and year of the first date
+            day = _BARE_DAY.match(text, join.end())
+            if not day:
+                continue
+            try:
+                second_range = _day(first_range.start.replace(day=int(day.group("day"))))
+            except ValueError:
+                continue
+
+        if second_range.end > first_range.start:
+            return DateRange(first_range.start, second_range.end)
+
+    since = _SINCE.search(text)
+    if since:
+        first = _match_at(text, since.end(), now)
+        if first:
+            return DateRange(first[0].start, now)
+    return None
+
+
+def resolve_date_range(text: str, now: datetime = None):
+    """
+    Resolves a relative or absolute date expression ("yesterday", "last week",
+    "between March 3 and 5", "this morning", "tuesday afternoon", ...) found in
+    `text` to a bounded DateRange in local time. Returns None if there is none.
+    """
+    if not text:
+        return None
+    now = now or datetime.now()
+    text = " ".join(text.lower().split())
+
+    date_range = _resolve_range(text, now)
+    if date_range:
+        return date_range
+
+    for pattern, handler in EXPRESSIONS:
+        match = pattern.search(text)
+        if match:
+            try:
+                return handler(match, now)
+            except (ValueError, OverflowError):
+                continue
+    return None
+
+
+def local_to_webkit(value: datetime) -> int:
+    """
+    Browsers record visit times in UTC; resolved ranges are in local time.
+    """
+    return datetime_to_webkit(value.astimezone(timezone.utc).replace(tzinfo=None))
+
+
+def to_webkit_range(date_range: DateRange):
+    return local_to_webkit(date_range.start), local_to_webkit(date_range.end)
@@ -0,0 +1,65 @@
+import os
+import re
+import time
+
+# Simulated latencies (seconds) so streaming and timeouts can be exercised without an API key
+FAKE_FIRST_CHUNK_DELAY = float(os.environ.get("FAKE_MODEL_FIRST_CHUNK_DELAY", "0.3"))
+FAKE_CHUNK_DELAY = float(os.environ.get("FAKE_MODEL_CHUNK_DELAY", "0.05"))
+
+# Roughly the size of the chunks Gemini streams back
+FAKE_CHUNK_WORDS = 8
+
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeResponse:
+    """
+    Mimics the SDK's GenerateContentResponse: `.text` for the full answer, and
+    iterating yields chunks (with their delays) when created with stream=True.
+    """
+
+    def __init__(self, chunks, stream: bool):
+        self._chunks = chunks
+        self._stream = stream
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if self._stream:
+                time.sleep(FAKE_FIRST_CHUNK_DELAY if i == 0 else FAKE_CHUNK_DELAY)
+            yield FakeChunk(chunk)
+
+
+class FakeModel:
+    """
+    Stand-in for genai.GenerativeModel, selected with GEMINI_FAKE_MODEL=1. It
+    answers every prompt with a canned Markdown reply about the user's question.
+    """
+
+    def __init__(self, model_name: str = "fake"):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, safety_settings=None,
+                         request_options=None, stream=False):
+        match = re.search(r"\*Current User Question\*:\s*\n(.+)", prompt)
+        question = match.group(1).strip() if match else prompt.strip()[:80]
+        answer = (
+            f"Hello! Here's a quick take on **{question}**.\n\n"
+            "- This reply comes from the fake model used for local testing.\n"
+            "- It streams in small chunks, the same way Gemini does.\n\n"
+            "Want me to go deeper on any part of it?"
+        )
+        words = answer.split(" ")
+        chunks = [
+            " ".join(words[i:i + FAKE_CHUNK_WORDS]) + (" " if i + FAKE_CHUNK_WORDS < len(words) else "")
+            for i in range(0, len(words), FAKE_CHUNK_WORDS)
+        ]
+        if not stream:
+            time.sleep(FAKE_FIRST_CHUNK_DELAY + FAKE_CHUNK_DELAY * (len(chunks) - 1))
+        return FakeResponse(chunks, stream)
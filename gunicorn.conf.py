@@ -0,0 +1,53 @@
+import gc
+import os
+import glob
+import tempfile
+import multiprocessing
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# One process per core; threads cover requests that mostly wait on DuckDuckGo or Gemini
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+# Load the app (spaCy pipeline, keyword matchers, Gemini client) once in the master;
+# forked workers share those pages copy-on-write instead of each loading their own
+preload_app = True
+
+# Above GEMINI_TIMEOUT, so a slow answer fails with a message instead of a killed worker
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Sync the history stores and build their indexes in the master before forking, so
+# workers share them instead of each building its own. Off by default: it reads local
+# browser history at startup, before anyone has enabled history access.
+warm_history = os.environ.get("HISTORY_WARM_UP") == "1"
+
+# Workers write their counters here and /metrics adds them up, so a scrape that lands on
+# any worker reports the whole server; see metrics.py
+if "METRICS_DIR" not in os.environ:
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="ddc-chatbot-metrics-")
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    # Counts left over from a previous run in a fixed METRICS_DIR would be added to this one
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def when_ready(server):
+    if warm_history:
+        from history_engine import history_engine
+        server.log.info("Warming up history indexes")
+        history_engine.warm_up()
+
+    # Move everything loaded so far out of the collector's reach, so collections in
+    # the workers don't touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,176 @@
+import calendar
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from history_engine import history_engine
+from keyword_matcher import KeywordMatcher
+from history_sources import UNIX_TO_WEBKIT_MICROSECONDS
+
+# Visits without a recorded duration are credited with the gap to the next visit, up to this cap
+IDLE_CAP_MICROSECONDS = 30 * 60 * 1000000
+
+# Which breakdown an analytics question asks for, matched on word boundaries; checked in this order
+chart_matcher = KeywordMatcher({
+    "heatmap": ["heatmap", "weekday", "weekdays", "day of week", "days of the week"],
+    "hourly": ["hour", "hours", "hourly", "when", "time of day", "busiest"],
+    "time": ["time", "spent", "spend", "long", "dwell"],
+})
+
+# Column arrays for every visit in a time range, across all browsers, oldest first.
+# domain_codes index into `domains`.
+VisitFrame = namedtuple("VisitFrame", ["times", "durations", "domain_codes", "domains"])
+
+
+def load_visits(start_time=None, end_time=None, browsers=None) -> VisitFrame:
+    """
+    Bulk-loads visits into NumPy arrays. Domains (parsed once at ingest) are
+    coded per distinct url, then mapped onto visits with a vectorized lookup.
+    """
+    def read(store):
+        return store.visit_columns(start_time, end_time), store.visited_domains(start_time, end_time)
+
+    domain_index = {}
+    times, durations, codes = [], [], []
+    for _, (visits, url_domains) in history_engine.map_stores(read, browsers):
+        if not visits:
+            continue
+        columns = np.array(visits, dtype=np.int64)
+
+        url_ids = np.array([url_id for url_id, _ in url_domains], dtype=np.int64)
+        url_codes = np.array(
+            [domain_index.setdefault(domain, len(domain_index)) for _, domain in url_domains],
+            dtype=np.int32,
+        )
+        order = np.argsort(url_ids)
+        url_ids, url_codes = url_ids[order], url_codes[order]
+
+        times.append(columns[:, 0])
+        durations.append(columns[:, 1])
+        codes.append(url_codes[np.searchsorted(url_ids, columns[:, 2])])
+
+    if not times:
+        empty = np.empty(0, dtype=np.int64)
+        return VisitFrame(empty, empty, np.empty(0, dtype=np.int32), np.empty(0, dtype=object))
+
+    times = np.concatenate(times)
+    order = np.argsort(times, kind="stable")
+    domains = np.empty(len(domain_index), dtype=object)
+    for domain, code in domain_index.items():
+        domains[code] = domain
+    return VisitFrame(
+        times[order], np.concatenate(durations)[order], np.concatenate(codes)[order], domains
+    )
+
+
+def local_datetimes(times: np.ndarray) -> np.ndarray:
+    """
+    WebKit timestamps to local datetime64[us], using the current UTC offset.
+    """
+    offset = int(datetime.now().astimezone().utcoffset().total_seconds() * 1000000)
+    return (times - UNIX_TO_WEBKIT_MICROSECONDS + offset).astype("datetime64[us]")
+
+
+def dwell_times(frame: VisitFrame) -> np.ndarray:
+    """
+    Time spent per visit in microseconds: the recorded duration where the browser
+    keeps one, otherwise the gap until the next visit, both capped at IDLE_CAP.
+    """
+    if not len(frame.times):
+        return np.empty(0, dtype=np.int64)
+    gaps = np.diff(frame.times, append=frame.times[-1])
+    estimate = np.where(frame.durations > 0, frame.durations, gaps)
+    return np.minimum(estimate, IDLE_CAP_MICROSECONDS)
+
+
+def top_domains(frame: VisitFrame, n: int = 10, by: str = "visits"):
+    """
+    Returns [(domain, value)] for the n largest domains, by visit count or by dwell time (seconds).
+    """
+    if not len(frame.times):
+        return []
+    weights = dwell_times(frame) / 1e6 if by == "time" else None
+    totals = np.bincount(frame.domain_codes, weights=weights, minlength=len(frame.domains))
+    n = min(n, len(totals))
+    top = np.argpartition(-totals, n - 1)[:n]
+    top = top[np.argsort(-totals[top], kind="stable")]
+    return [(frame.domains[code] or "(local)", totals[code].item()) for code in top if totals[code] > 0]
+
+
+def visits_per_hour(frame: VisitFrame) -> np.ndarray:
+    hours = local_datetimes(frame.times).astype("datetime64[h]").astype(np.int64) % 24
+    return np.bincount(hours, minlength=24)
+
+
+def activity_heatmap(frame: VisitFrame) -> np.ndarray:
+    """
+    7x24 visit counts, rows Monday..Sunday, columns hour of day.
+    """
+    local = local_datetimes(frame.times)
+    hours = local.astype("datetime64[h]").astype(np.int64) % 24
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekdays = (local.astype("datetime64[D]").astype(np.int64) + 3) % 7
+    return np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+
+
+# --- Chat answers ---
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes >= 60:
+        return f"{minutes // 60}h {minutes % 60}m"
+    return f"{minutes}m" if minutes else f"{int(seconds)}s"
+
+
+def _bar(value: int, peak: int, width: int = 20) -> str:
+    return "█" * max(1 if value else 0, round(width * value / peak)) if peak else ""
+
+
+def pick_chart(question: str) -> str:
+    """
+    "heatmap", "hourly", "time" (where the time went) or "domains" (top domains).
+    """
+    matched = chart_matcher.match(question)
+    for chart in ("heatmap", "hourly", "time"):
+        if matched.has(chart):
+            return chart
+    return "domains"
+
+
+def analyze_history(question: str, start_time=None, end_time=None) -> str:
+    """
+    Answers an analytics question ("top domains yesterday", "visits per hour",
+    "which sites did I spend most time on") over the visits in range.
+    """
+    frame = load_visits(start_time, end_time)
+    if not len(frame.times):
+        return "No browsing activity found for that period."
+
+    chart = pick_chart(question)
+    lines = [f"**{len(frame.times):,} visits across {len(frame.domains):,} sites.**", ""]
+
+    if chart == "heatmap":
+        heatmap = activity_heatmap(frame)
+        per_day = heatmap.sum(axis=1)
+        lines.append("**Visits by day of week:**")
+        for day, count in zip(calendar.day_name, per_day):
+            lines.append(f"- {day}: {count:,} {_bar(count, per_day.max())}")
+        busiest_day, busiest_hour = np.unravel_index(np.argmax(heatmap), heatmap.shape)
+        lines.append("")
+        lines.append(f"Busiest slot: **{calendar.day_name[busiest_day]} {busiest_hour:02d}:00**.")
+    elif chart == "hourly":
+        hourly = visits_per_hour(frame)
+        lines.append("**Visits per hour of day:**")
+        for hour, count in enumerate(hourly):
+            if count:
+                lines.append(f"- {hour:02d}:00 {count:,} {_bar(count, hourly.max())}")
+    elif chart == "time":
+        lines.append("**Where your time went:**")
+        for domain, seconds in top_domains(frame, by="time"):
+            lines.append(f"- {domain}: {format_duration(seconds)}")
+    else:
+        lines.append("**Top domains:**")
+        for domain, count in top_domains(frame):
+            lines.append(f"- {domain}: {int(count):,} visits")
+
+    return "\n".join(lines)
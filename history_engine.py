@@ -0,0 +1,243 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from itertools import islice
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from history_sources import discover_sources
+from history_store import get_history_store, build_match_query
+from semantic_index import get_semantic_index
+
+# Profiles are re-discovered at most this often (seconds)
+SOURCE_DISCOVERY_INTERVAL = 60
+
+# Sources are synced and queried in parallel, one thread per source up to this limit
+MAX_READER_THREADS = int(os.environ.get("HISTORY_READER_THREADS", "8"))
+
+# Reciprocal rank fusion constant: larger values flatten the advantage of the very top ranks
+RRF_K = 60
+
+# Larger than any SQLite rowid; used to build per-source keyset bounds
+MAX_ROW_ID = 2 ** 63 - 1
+
+HistoryEntry = namedtuple("HistoryEntry", ["source", "id", "url", "title", "last_visit_time"])
+
+
+def _time_order(entry: HistoryEntry):
+    # Global order across sources: newest first, ties broken by source then row id
+    return entry.last_visit_time, entry.source.name, entry.id
+
+
+def encode_cursor(entry: HistoryEntry) -> str:
+    return f"{entry.last_visit_time}:{entry.id}:{entry.source.name}"
+
+
+def decode_cursor(cursor: str):
+    try:
+        last_visit_time, url_id, name = cursor.split(":", 2)
+        return int(last_visit_time), int(url_id), name
+    except ValueError:
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+
+
+def _source_before(cursor, name: str):
+    """
+    Translates the global (last_visit_time, source, id) cursor into the
+    (last_visit_time, id) keyset bound for one source's store.
+    """
+    last_visit_time, url_id, cursor_name = cursor
+    if name < cursor_name:
+        return last_visit_time, MAX_ROW_ID
+    if name == cursor_name:
+        return last_visit_time, url_id
+    return last_visit_time, 0
+
+
+class HistoryEngine:
+    """
+    History across every browser profile on the machine.
+
+    Each source (Brave, Chrome, Chromium, Edge, Firefox profile) has its own local
+    store. Sources are synced and queried concurrently in a thread pool, and the
+    per-source results, each already sorted, are combined with a k-way merge.
+    """
+
+    def __init__(self, sources=None, max_workers: int = MAX_READER_THREADS):
+        self._fixed_sources = sources
+        self._sources = []
+        self._discovered_at = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history")
+
+    def sources(self, browsers=None):
+        if self._fixed_sources is not None:
+            sources = self._fixed_sources
+        else:
+            with self._lock:
+                now = time.monotonic()
+                if self._discovered_at is None or now - self._discovered_at > SOURCE_DISCOVERY_INTERVAL:
+                    self._sources = discover_sources()
+                    self._discovered_at = now
+                sources = self._sources
+
+        if browsers:
+            wanted = {browser.lower() for browser in browsers}
+            sources = [source for source in sources if source.browser.lower() in wanted]
+        return sources
+
+    def map_stores(self, read, browsers=None):
+        """
+        Syncs every source's store and runs read(store) on it, all concurrently.
+        Returns (source, result) pairs; a failing source is logged and skipped.
+        """
+        def run(source):
+            store = get_history_store(source)
+            store.sync()
+            return read(store)
+
+        futures = [(source, self._executor.submit(run, source)) for source in self.sources(browsers)]
+        results = []
+        for source, future in futures:
+            try:
+                results.append((source, future.result()))
+            except Exception as e:
+                logging.error("Error reading %s history: %s", source.label, e)
+        return results
+
+    def stores(self, browsers=None):
+        """
+        Syncs every source concurrently and returns (source, store) pairs.
+        """
+        return self.map_stores(lambda store: store, browsers)
+
+    def search(self, keywords=None, start_time=None, end_time=None, limit=50, browsers=None):
+        """
+        Returns up to `limit` HistoryEntry rows across all sources. Keyword searches
+        are interleaved by per-source BM25 rank (scores from different indexes are
+        not comparable); otherwise rows are merged newest first.
+        """
+        def read(store):
+            return store.search(keywords, start_time, end_time, limit=limit)
+
+        streams = [
+            [HistoryEntry(source, None, *row) for row in rows]
+            for source, rows in self.map_stores(read, browsers)
+        ]
+        if build_match_query(keywords):
+            ranked = heapq.merge(*(enumerate(rows) for rows in streams), key=lambda item: item[0])
+            merged = (entry for _, entry in ranked)
+        else:
+            merged = heapq.merge(*streams, key=lambda entry: entry.last_visit_time, reverse=True)
+        return list(islice(merged, limit))
+
+    def page(self, keywords=None, start_time=None, end_time=None, cursor=None, limit=50, browsers=None):
+        """
+        Returns one page of HistoryEntry rows across all sources, newest first,
+        and the cursor for the next page (None on the last page).
+        """
+        decoded = decode_cursor(cursor) if cursor else None
+
+        def read(store):
+            before = _source_before(decoded, store.source.name) if decoded else None
+            return store.keyset_page(keywords, start_time, end_time, before=before, limit=limit + 1)
+
+        streams = [
+            [HistoryEntry(source, *row) for row in rows]
+            for source, rows in self.map_stores(read, browsers)
+        ]
+        entries = list(islice(heapq.merge(*streams, key=_time_order, reverse=True), limit + 1))
+
+        next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+        return entries[:limit], next_cursor
+
+    def semantic_search(self, text, start_time=None, end_time=None, limit=20, browsers=None):
+        """
+        Returns up to `limit` (HistoryEntry, score) pairs, best first, for pages whose
+        title, URL words or domain resemble `text`, optionally only pages visited
+        in [start_time, end_time). Each source's semantic index is brought up to
+        date with its store first.
+        """
+        def read(store):
+            index = get_semantic_index(store.source)
+            indexed = index.refresh(store)
+            if indexed:
+                logging.debug("Indexed %d pages for %s", indexed, store.source.label)
+            allowed = None
+            if start_time is not None or end_time is not None:
+                allowed = store.visited_url_ids(start_time, end_time)
+            hits = index.search(text, k=limit, allowed_ids=allowed)
+            pages = store.urls_by_id((hit.url_id for hit in hits), start_time, end_time)
+            return [(hit, pages[hit.url_id]) for hit in hits if hit.url_id in pages]
+
+        results = [
+            (HistoryEntry(source, hit.url_id, url, title, last_visit_time), hit.score)
+            for source, hits in self.map_stores(read, browsers)
+            for hit, (url, title, last_visit_time) in hits
+        ]
+        results.sort(key=lambda item: (-item[1], -item[0].last_visit_time))
+        return results[:limit]
+
+    def ranked_search(self, keywords, start_time=None, end_time=None, limit=20, browsers=None):
+        """
+        Returns up to `limit` HistoryEntry rows for a keyword question, fusing the
+        BM25 full-text ranking with the semantic ranking (reciprocal rank fusion).
+        Exact matches keep their BM25 order, and pages that only resemble the
+        keywords can still rank among them. If the semantic index fails, the
+        full-text ranking is used on its own.
+        """
+        exact = self.search(keywords, start_time, end_time, limit=limit, browsers=browsers)
+        text = keywords if isinstance(keywords, str) else " ".join(keywords)
+        try:
+            similar = [entry for entry, _ in self.semantic_search(text, start_time, end_time, limit, browsers)]
+        except Exception as e:
+            logging.error("Error searching the semantic history index: %s", e)
+            similar = []
+
+        scores, entries = {}, {}
+        for ranking in (exact, similar):
+            for rank, entry in enumerate(ranking):
+                key = entry.source.name, entry.url
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                entries.setdefault(key, entry)
+        # Best fused score first; ties go to the more recent visit
+        ranked = sorted(scores, key=lambda key: (-scores[key], -entries[key].last_visit_time))
+        return [entries[key] for key in ranked[:limit]]
+
+    def iter_entries(self, keywords=None, start_time=None, end_time=None, page_size=200, browsers=None):
+        """
+        Yields every matching HistoryEntry across all sources, newest first. Each
+        source is read lazily one page at a time, so memory stays flat.
+        """
+        def tagged(source, store):
+            for row in store.iter_rows(keywords, start_time, end_time, page_size=page_size):
+                yield HistoryEntry(source, None, *row)
+
+        streams = [tagged(source, store) for source, store in self.stores(browsers)]
+        yield from heapq.merge(*streams, key=lambda entry: entry.last_visit_time, reverse=True)
+
+
+    def warm_up(self, browsers=None):
+        """
+        Syncs every store and builds its semantic and session indexes, one source
+        at a time and without the thread pool, so it is safe to run before a fork.
+        Under a preloading server the workers then share the indexes copy-on-write
+        and only index what is new.
+        """
+        # Imported here: history_sessions builds on this module
+        from history_sessions import get_session_index
+
+        for source in self.sources(browsers):
+            try:
+                store = get_history_store(source)
+                store.sync()
+                get_semantic_index(source).refresh(store)
+                get_session_index(source).refresh(store)
+            except Exception as e:
+                logging.error("Error warming up %s history: %s", source.label, e)
+
+
+# Shared by every request in the process
+history_engine = HistoryEngine()
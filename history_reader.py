@@ -0,0 +1,214 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# Connections kept open per browser database between requests
+POOL_SIZE = int(os.environ.get("HISTORY_READER_POOL_SIZE", "4"))
+
+# In-memory snapshots are only taken while the browser holds a lock. One is refreshed,
+# in the background, once the database has changed and the snapshot is this old.
+SNAPSHOT_MAX_AGE = float(os.environ.get("HISTORY_SNAPSHOT_MAX_AGE", "30"))
+
+# Don't wait on the browser's write lock; fall back to a snapshot instead
+BUSY_TIMEOUT = 0.1
+
+# sqlite3 keeps prepared statements per connection, so reusing connections reuses them
+STATEMENT_CACHE_SIZE = 256
+
+
+def _uri(path: str, **params) -> str:
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return f"file:{quote(path)}?{query}"
+
+
+def _modified(path: str) -> int:
+    """
+    Latest modification time of the database and its journal/WAL, 0 if unreadable.
+    """
+    latest = 0
+    for name in (path, path + "-journal", path + "-wal"):
+        try:
+            latest = max(latest, os.stat(name).st_mtime_ns)
+        except OSError:
+            pass
+    return latest
+
+
+class _PooledConnection:
+    def __init__(self, conn: sqlite3.Connection, snapshot: bool, modified: int = 0):
+        self.conn = conn
+        self.snapshot = snapshot
+        self.modified = modified  # source mtime when the snapshot was taken
+        self.created = time.monotonic()
+
+    def expired(self, path: str) -> bool:
+        return (
+            self.snapshot
+            and time.monotonic() - self.created > SNAPSHOT_MAX_AGE
+            and _modified(path) != self.modified
+        )
+
+
+class HistoryReader:
+    """
+    Read-only access to browser history databases without copying them.
+
+    Databases are opened with a `mode=ro` URI. When the browser holds a lock that
+    blocks readers, the database is opened `immutable` and copied into memory with
+    the SQLite online backup API. Connections are pooled per database path and
+    reused across requests.
+
+    A running Chromium keeps its database locked, so snapshots are the usual
+    case. Only the first one is taken on the request path. After that a stale
+    snapshot keeps serving while a fresh copy is made in a background thread,
+    and only once the database file has actually changed.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE):
+        self.pool_size = pool_size
+        self._pools = {}
+        self._latest = {}  # path -> creation time of the newest snapshot
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # Pooled connections must not cross fork(); preforked workers start with empty pools
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._latest = {}
+        self._refreshing = set()
+
+    def _pool(self, path: str) -> queue.LifoQueue:
+        with self._lock:
+            pool = self._pools.get(path)
+            if pool is None:
+                pool = self._pools[path] = queue.LifoQueue(maxsize=self.pool_size)
+            return pool
+
+    def _connect(self, uri: str) -> sqlite3.Connection:
+        return sqlite3.connect(
+            uri,
+            uri=True,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+
+    def _open(self, path: str) -> _PooledConnection:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Browser history not found: {path}")
+
+        conn = self._connect(_uri(path, mode="ro"))
+        try:
+            # Touch the schema so lock errors surface here rather than mid-query
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+            return _PooledConnection(conn, snapshot=False)
+        except sqlite3.OperationalError as e:
+            conn.close()
+            logging.debug("Read-only open of %s failed (%s); taking an in-memory snapshot", path, e)
+            return self._snapshot(path)
+
+    def _snapshot(self, path: str) -> _PooledConnection:
+        modified = _modified(path)
+        source = self._connect(_uri(path, mode="ro", immutable=1))
+        try:
+            memory = sqlite3.connect(
+                ":memory:", check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE
+            )
+            source.backup(memory)
+        finally:
+            source.close()
+        pooled = _PooledConnection(memory, snapshot=True, modified=modified)
+        with self._lock:
+            self._latest[path] = max(self._latest.get(path, 0), pooled.created)
+        return pooled
+
+    def _superseded(self, path: str, pooled: _PooledConnection) -> bool:
+        with self._lock:
+            return pooled.snapshot and pooled.created < self._latest.get(path, 0)
+
+    def _refresh_in_background(self, path: str):
+        with self._lock:
+            if path in self._refreshing:
+                return
+            self._refreshing.add(path)
+
+        def refresh():
+            try:
+                pooled = self._snapshot(path)
+                pool = self._pool(path)
+                try:
+                    pool.put_nowait(pooled)
+                except queue.Full:
+                    # The pool only holds older snapshots now; make room for the new one
+                    try:
+                        pool.get_nowait().conn.close()
+                    except queue.Empty:
+                        pass
+                    try:
+                        pool.put_nowait(pooled)
+                    except queue.Full:
+                        pooled.conn.close()
+            except Exception as e:
+                logging.warning("Refreshing the snapshot of %s failed: %s", path, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(path)
+
+        threading.Thread(target=refresh, name="history-snapshot", daemon=True).start()
+
+    @contextmanager
+    def connection(self, path: str):
+        """
+        Borrows a read-only connection to the database at `path`.
+        """
+        pool = self._pool(path)
+        pooled = None
+        while pooled is None:
+            try:
+                pooled = pool.get_nowait()
+            except queue.Empty:
+                pooled = self._open(path)
+                break
+            if self._superseded(path, pooled):
+                pooled.conn.close()
+                pooled = None
+
+        if pooled.expired(path):
+            self._refresh_in_background(path)
+
+        try:
+            yield pooled.conn
+        except sqlite3.DatabaseError:
+            # Don't hand a connection in an unknown state to the next request
+            pooled.conn.close()
+            pooled = None
+            raise
+        finally:
+            if pooled is not None and not self._superseded(path, pooled):
+                try:
+                    pool.put_nowait(pooled)
+                except queue.Full:
+                    pooled.conn.close()
+            elif pooled is not None:
+                pooled.conn.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while True:
+                try:
+                    pool.get_nowait().conn.close()
+                except queue.Empty:
+                    break
+
+
+# Shared by every request in the process
+history_reader = HistoryReader()
@@ -0,0 +1,276 @@
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+from history_engine import history_engine
+from history_store import get_history_store
+from history_sources import UNIX_TO_WEBKIT_MICROSECONDS
+from history_analytics import IDLE_CAP_MICROSECONDS, format_duration
+
+# This long without browsing ends a session
+SESSION_IDLE_GAP = int(float(os.environ.get("HISTORY_SESSION_GAP_MINUTES", "30")) * 60 * 1000000)
+
+# Sessions with fewer visits (a single lookup) are left out of answers
+MIN_SESSION_VISITS = 3
+
+# Most sessions described in one answer; the busiest ones are kept
+MAX_SESSIONS_SHOWN = 6
+
+# Visits read to summarize one session; an all-day session is described by its first stretch
+SUMMARY_VISIT_LIMIT = 2000
+
+# Visits read from the store per refresh batch
+REFRESH_BATCH_SIZE = 20000
+
+# Search pages, by domain, and the URL parameter holding what was searched for
+SEARCH_PARAMETERS = {
+    "google.com": "q", "bing.com": "q", "duckduckgo.com": "q", "search.brave.com": "q",
+    "ecosia.org": "q", "search.yahoo.com": "p", "youtube.com": "search_query",
+}
+
+
+class BrowsingSession:
+    """
+    A stretch of browsing with no idle gap longer than SESSION_IDLE_GAP. Its
+    navigation chains are the referrer trees formed by from_visit links inside it.
+    """
+
+    __slots__ = ("start", "end", "active_until", "visits", "domains", "chains", "longest_chain", "longest_root")
+
+    def __init__(self, visit_time: int):
+        self.start = self.end = self.active_until = visit_time
+        self.visits = 0
+        self.domains = Counter()
+        self.chains = 0
+        self.longest_chain = 0  # pages in the deepest referrer chain
+        self.longest_root = None  # visit id that chain started from
+
+
+class SessionIndex:
+    """
+    Browsing sessions for one store, rebuilt incrementally: each refresh only
+    reads visits past the highest visit id seen so far. Summaries of sessions
+    are cached until the session gains visits, so repeat questions skip the store.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(generation=0)
+
+    def _reset(self, generation: int):
+        self.generation = generation
+        self.mark = 0  # highest visit id processed
+        self.sessions = []  # oldest first
+        self._starts = []  # session start times, for bisection
+        self._chains = {}  # visit id -> (depth, root visit id), for the open session only
+        self._summaries = {}  # session position -> (visits when summarized, summary)
+
+    def refresh(self, store) -> int:
+        """
+        Adds visits ingested since the last refresh. Returns how many were added.
+        """
+        with self._lock:
+            generation = store.generation
+            if generation != self.generation:
+                self._reset(generation)
+
+            added = 0
+            while True:
+                rows = store.visits_after(self.mark, limit=REFRESH_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    self._add(*row)
+                added += len(rows)
+                self.mark = rows[-1][0]
+            return added
+
+    def _add(self, visit_id, visit_time, from_visit, visit_duration, domain):
+        session = self.sessions[-1] if self.sessions else None
+        if session is not None and visit_time < session.start:
+            self._add_straggler(visit_id, visit_time, visit_duration, domain)
+            return
+        if session is None or visit_time - session.active_until > SESSION_IDLE_GAP:
+            session = BrowsingSession(visit_time)
+            self.sessions.append(session)
+            self._starts.append(visit_time)
+            self._chains = {}
+
+        self._count(session, visit_time, visit_duration, domain)
+
+        # A visit whose referrer is outside the session starts a new chain
+        parent = self._chains.get(from_visit) if from_visit else None
+        if parent is None:
+            depth, root = 1, visit_id
+            session.chains += 1
+        else:
+            depth, root = parent[0] + 1, parent[1]
+        self._chains[visit_id] = (depth, root)
+        if depth > session.longest_chain:
+            session.longest_chain, session.longest_root = depth, root
+
+    def _add_straggler(self, visit_id, visit_time, visit_duration, domain):
+        """
+        Visit ids are almost always in time order, but synced visits can arrive with
+        an old time. Such a visit joins the session that covers its time, or the one
+        it leads into, or gets its own; `_starts` stays sorted either way.
+        """
+        position = bisect_right(self._starts, visit_time) - 1
+        following = position + 1
+        if position >= 0 and visit_time - self.sessions[position].active_until <= SESSION_IDLE_GAP:
+            session = self.sessions[position]
+        elif self.sessions[following].start - visit_time <= SESSION_IDLE_GAP:
+            session = self.sessions[following]
+            session.start = self._starts[following] = visit_time
+        else:
+            session = BrowsingSession(visit_time)
+            self.sessions.insert(following, session)
+            self._starts.insert(following, visit_time)
+            # Summaries are cached by position; later sessions moved up by one
+            self._summaries = {
+                cached + (cached >= following): summary for cached, summary in self._summaries.items()
+            }
+
+        self._count(session, visit_time, visit_duration, domain)
+        # Its referrer can't be placed reliably; it starts a chain of its own
+        session.chains += 1
+        if session.longest_chain == 0:
+            session.longest_chain, session.longest_root = 1, visit_id
+
+    @staticmethod
+    def _count(session, visit_time, visit_duration, domain):
+        session.visits += 1
+        session.domains[domain] += 1
+        session.end = max(session.end, visit_time)
+        session.active_until = max(session.active_until, visit_time + min(visit_duration, IDLE_CAP_MICROSECONDS))
+
+    def between(self, start_time=None, end_time=None, limit=None, min_visits=MIN_SESSION_VISITS):
+        """
+        Returns (position, session) for sessions overlapping [start_time, end_time)
+        with at least `min_visits` visits, oldest first. With `limit`, only the
+        most recent that many.
+        """
+        with self._lock:
+            stop = len(self.sessions) if end_time is None else bisect_left(self._starts, end_time)
+            found = []
+            for position in range(stop - 1, -1, -1):
+                session = self.sessions[position]
+                if start_time is not None and session.end < start_time:
+                    break
+                if session.visits >= min_visits:
+                    found.append((position, session))
+                    if limit is not None and len(found) >= limit:
+                        break
+        return found[::-1]
+
+    def summary(self, store, position: int, session: BrowsingSession) -> str:
+        cached = self._summaries.get(position)
+        if cached is not None and cached[0] == session.visits:
+            return cached[1]
+        visits = session.visits
+        text = summarize_session(session, store.visit_pages(session.start, session.end, limit=SUMMARY_VISIT_LIMIT))
+        with self._lock:
+            self._summaries[position] = (visits, text)
+        return text
+
+
+def local_time(value: int) -> datetime:
+    return datetime.fromtimestamp((value - UNIX_TO_WEBKIT_MICROSECONDS) / 1000000)
+
+
+def search_terms(url: str, domain: str):
+    """
+    What was searched for, when `url` is a search results page.
+    """
+    parameter = SEARCH_PARAMETERS.get(domain)
+    if parameter is None:
+        return None
+    values = parse_qs(urlsplit(url).query).get(parameter)
+    return values[0].strip() if values and values[0].strip() else None
+
+
+def summarize_session(session: BrowsingSession, pages) -> str:
+    """
+    Describes a session from its (visit_id, url, title, domain) rows: when and
+    how long, the main sites, what was searched for, the most revisited pages
+    and where the longest chain of links started.
+    """
+    start, end = local_time(session.start), local_time(session.end)
+    span = f"{start:%a %b %d %H:%M}–{end:%H:%M}" if start.date() == end.date() else \
+        f"{start:%a %b %d %H:%M} – {end:%a %b %d %H:%M}"
+    length = format_duration((session.active_until - session.start) / 1000000)
+    sites = ", ".join(domain for domain, _ in session.domains.most_common(3) if domain)
+    lines = [f"**{span}** ({length}, {session.visits} visits, {session.chains} trails) — mostly {sites}"]
+
+    searches, titles, root_title = [], Counter(), None
+    for visit_id, url, title, domain in pages:
+        terms = search_terms(url, domain)
+        if terms:
+            if terms not in searches:
+                searches.append(terms)
+        elif title:
+            titles[title] += 1
+        if visit_id == session.longest_root:
+            root_title = f'a search for "{terms}"' if terms else title or url
+
+    if searches:
+        lines.append("  - Searched for: " + ", ".join(f'"{terms}"' for terms in searches[:5]))
+    if titles:
+        lines.append("  - Read: " + "; ".join(title for title, _ in titles.most_common(3)))
+    if session.longest_chain > 2 and root_title:
+        lines.append(f"  - Longest trail: {session.longest_chain} pages, starting from {root_title}")
+    return "\n".join(lines)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_session_index(source) -> SessionIndex:
+    """
+    Returns the shared session index for a browser profile, creating it on first use.
+    """
+    with _indexes_lock:
+        index = _indexes.get(source.name)
+        if index is None:
+            index = _indexes[source.name] = SessionIndex()
+        return index
+
+
+def answer_sessions(start_time=None, end_time=None, browsers=None) -> str:
+    """
+    Answers "what was I researching Tuesday afternoon": the busiest browsing
+    sessions in range (or the most recent ones), each with a short summary.
+    """
+    limit = MAX_SESSIONS_SHOWN if start_time is None and end_time is None else None
+
+    def read(store):
+        index = get_session_index(store.source)
+        index.refresh(store)
+        return index, index.between(start_time, end_time, limit=limit)
+
+    found = [
+        (source, index, position, session)
+        for source, (index, sessions) in history_engine.map_stores(read, browsers)
+        for position, session in sessions
+    ]
+    if not found:
+        return "No browsing sessions found for that period."
+
+    shown = sorted(found, key=lambda item: item[3].visits, reverse=True)[:MAX_SESSIONS_SHOWN]
+    shown.sort(key=lambda item: item[3].start)
+    several_browsers = len({source.name for source, _, _, _ in found}) > 1
+
+    if limit is not None:
+        lines = ["**Your most recent browsing sessions:**"]
+    else:
+        lines = [f"**{len(found)} browsing sessions.**" if len(found) > 1 else "**1 browsing session.**"]
+        if len(found) > len(shown):
+            lines[0] += f" The {len(shown)} busiest:"
+    for source, index, position, session in shown:
+        summary = index.summary(get_history_store(source), position, session)
+        lines.append(f"[{source.label}] {summary}" if several_browsers else summary)
+    return "\n\n".join(lines)
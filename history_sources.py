@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import glob
+
+# Offset between the Unix epoch (Firefox) and the WebKit epoch (Chromium), in microseconds
+UNIX_TO_WEBKIT_MICROSECONDS = 11644473600 * 1000000
+
+
+class HistorySource:
+    """
+    One browser profile's history database.
+
+    Subclasses supply the SQL that reads rows past the store's high-water marks
+    and normalizes them to the store's Chromium-style layout, with WebKit timestamps:
+      max_ids:  (max url id, max visit id)
+      urls:     (id, url, title, visit_count, last_visit_time) for params (url_mark, visit_mark)
+      visits:   (id, url_id, visit_time, from_visit, transition, visit_duration) for params (visit_mark,)
+      counts:   (url rows, visit rows) the store should hold, to detect deletions
+      url_ids / visit_ids: every id the store should hold, to find which rows were deleted
+    """
+
+    MAX_IDS_SQL = None
+    URLS_SQL = None
+    VISITS_SQL = None
+    COUNTS_SQL = None
+    URL_IDS_SQL = None
+    VISIT_IDS_SQL = None
+
+    def __init__(self, browser: str, profile: str, path: str):
+        self.browser = browser
+        self.profile = profile
+        self.path = path
+
+    @property
+    def name(self) -> str:
+        profile = re.sub(r"[^a-z0-9]+", "-", self.profile.lower()).strip("-")
+        return f"{self.browser.lower()}-{profile}"
+
+    @property
+    def label(self) -> str:
+        return self.browser if self.profile == "Default" else f"{self.browser} ({self.profile})"
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.browser!r}, {self.profile!r}, {self.path!r})"
+
+
+class ChromiumSource(HistorySource):
+    """
+    Brave, Chrome, Chromium and Edge all share Chromium's `History` schema.
+    """
+
+    MAX_IDS_SQL = "SELECT (SELECT MAX(id) FROM urls), (SELECT MAX(id) FROM visits)"
+
+    # New visits are what move urls.last_visit_time forward, so the urls touched by
+    # new visits are exactly the urls rows that changed since the last sync.
+    URLS_SQL = """
+        SELECT id, url, title, visit_count, last_visit_time
+        FROM urls
+        WHERE id > ? OR id IN (SELECT url FROM visits WHERE id > ?)
+    """
+    VISITS_SQL = """
+        SELECT id, url, visit_time, from_visit, transition, visit_duration
+        FROM visits
+        WHERE id > ?
+        ORDER BY id
+    """
+    COUNTS_SQL = "SELECT (SELECT COUNT(*) FROM urls), (SELECT COUNT(*) FROM visits)"
+    URL_IDS_SQL = "SELECT id FROM urls"
+    VISIT_IDS_SQL = "SELECT id FROM visits"
+
+
+class FirefoxSource(HistorySource):
+    """
+    Firefox `places.sqlite`. Timestamps are microseconds since the Unix epoch and
+    are shifted to the WebKit epoch; there is no visit duration.
+    """
+
+    MAX_IDS_SQL = "SELECT (SELECT MAX(id) FROM moz_places), (SELECT MAX(id) FROM moz_historyvisits)"
+    URLS_SQL = f"""
+        SELECT id, url, title, visit_count, last_visit_date + {UNIX_TO_WEBKIT_MICROSECONDS}
+        FROM moz_places
+        WHERE (id > ? OR id IN (SELECT place_id FROM moz_historyvisits WHERE id > ?))
+          AND last_visit_date IS NOT NULL
+    """
+    VISITS_SQL = f"""
+        SELECT id, place_id, visit_date + {UNIX_TO_WEBKIT_MICROSECONDS}, from_visit, visit_type, 0
+        FROM moz_historyvisits
+        WHERE id > ?
+        ORDER BY id
+    """
+    COUNTS_SQL = """
+        SELECT (SELECT COUNT(*) FROM moz_places WHERE last_visit_date IS NOT NULL),
+               (SELECT COUNT(*) FROM moz_historyvisits)
+    """
+    URL_IDS_SQL = "SELECT id FROM moz_places WHERE last_visit_date IS NOT NULL"
+    VISIT_IDS_SQL = "SELECT id FROM moz_historyvisits"
+
+    def __init__(self, profile: str, path: str):
+        super().__init__("Firefox", profile, path)
+
+
+# --- Discovery ---
+def _chromium_user_data_dirs():
+    home = os.path.expanduser("~")
+    if sys.platform.startswith("win"):
+        local = os.environ.get("LOCALAPPDATA", os.path.join(home, "AppData", "Local"))
+        return {
+            "Brave": os.path.join(local, "BraveSoftware", "Brave-Browser", "User Data"),
+            "Chrome": os.path.join(local, "Google", "Chrome", "User Data"),
+            "Chromium": os.path.join(local, "Chromium", "User Data"),
+            "Edge": os.path.join(local, "Microsoft", "Edge", "User Data"),
+        }
+    if sys.platform == "darwin":
+        support = os.path.join(home, "Library", "Application Support")
+        return {
+            "Brave": os.path.join(support, "BraveSoftware", "Brave-Browser"),
+            "Chrome": os.path.join(support, "Google", "Chrome"),
+            "Chromium": os.path.join(support, "Chromium"),
+            "Edge": os.path.join(support, "Microsoft Edge"),
+        }
+    config = os.environ.get("XDG_CONFIG_HOME", os.path.join(home, ".config"))
+    return {
+        "Brave": os.path.join(config, "BraveSoftware", "Brave-Browser"),
+        "Chrome": os.path.join(config, "google-chrome"),
+        "Chromium": os.path.join(config, "chromium"),
+        "Edge": os.path.join(config, "microsoft-edge"),
+    }
+
+
+def _firefox_profiles_dir():
+    home = os.path.expanduser("~")
+    if sys.platform.startswith("win"):
+        roaming = os.environ.get("APPDATA", os.path.join(home, "AppData", "Roaming"))
+        return os.path.join(roaming, "Mozilla", "Firefox", "Profiles")
+    if sys.platform == "darwin":
+        return os.path.join(home, "Library", "Application Support", "Firefox", "Profiles")
+    return os.path.join(home, ".mozilla", "firefox")
+
+
+def discover_sources():
+    """
+    Finds every Chromium-family and Firefox profile with a history database on this machine.
+    EDGE_HISTORY_PATH still points at an explicit Edge `History` file.
+    """
+    sources = []
+    seen = set()
+
+    def add(source):
+        path = os.path.realpath(source.path)
+        if path not in seen:
+            seen.add(path)
+            sources.append(source)
+
+    edge_path = os.environ.get("EDGE_HISTORY_PATH")
+    if edge_path and os.path.isfile(edge_path):
+        add(ChromiumSource("Edge", "Default", edge_path))
+
+    for browser, user_data in _chromium_user_data_dirs().items():
+        # Profiles are "Default", "Profile 1", "Profile 2", ...
+        for path in sorted(glob.glob(os.path.join(glob.escape(user_data), "*", "History"))):
+            add(ChromiumSource(browser, os.path.basename(os.path.dirname(path)), path))
+
+    for path in sorted(glob.glob(os.path.join(glob.escape(_firefox_profiles_dir()), "*", "places.sqlite"))):
+        add(FirefoxSource(os.path.basename(os.path.dirname(path)), path))
+
+    return sources
@@ -0,0 +1,594 @@
+import os
+import sqlite3
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, unquote_plus
+
+from history_reader import history_reader
+
+try:
+    import fcntl
+except ImportError:  # Windows: syncs are only serialized within the process
+    fcntl = None
+
+# How long (seconds) a store write waits for another worker process holding the write lock
+STORE_BUSY_TIMEOUT = float(os.environ.get("HISTORY_STORE_BUSY_TIMEOUT", "60"))
+
+# Chromium-based browsers store timestamps as microseconds since 1601-01-01 (WebKit epoch)
+WEBKIT_EPOCH = datetime(1601, 1, 1)
+
+# Where the local history indexes live. Kept outside the repo and readable by the owner only.
+HISTORY_STORE_DIR = os.environ.get(
+    "HISTORY_STORE_DIR", os.path.expanduser("~/.cache/ddc-chatbot/history")
+)
+
+
+def webkit_to_datetime(value: int) -> datetime:
+    return WEBKIT_EPOCH + timedelta(microseconds=value or 0)
+
+
+def datetime_to_webkit(value: datetime) -> int:
+    return (value - WEBKIT_EPOCH) // timedelta(microseconds=1)
+
+
+# Bump when the layout changes; the store is a cache of the browser DB and is rebuilt on mismatch
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT,
+    url_tokens TEXT NOT NULL DEFAULT '',
+    domain TEXT NOT NULL DEFAULT '',
+    visit_count INTEGER NOT NULL DEFAULT 0,
+    last_visit_time INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS urls_last_visit_time ON urls(last_visit_time, id);
+
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY,
+    url_id INTEGER NOT NULL,
+    visit_time INTEGER NOT NULL,
+    from_visit INTEGER NOT NULL DEFAULT 0,
+    transition INTEGER NOT NULL DEFAULT 0,
+    visit_duration INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS visits_visit_time ON visits(visit_time, url_id, visit_duration);
+CREATE INDEX IF NOT EXISTS visits_url_id ON visits(url_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Full-text index over titles, URLs and URL tokens, kept in sync with `urls` by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS urls_fts USING fts5(
+    title, url, url_tokens,
+    content='urls', content_rowid='id',
+    tokenize='unicode61', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS urls_fts_insert AFTER INSERT ON urls BEGIN
+    INSERT INTO urls_fts (rowid, title, url, url_tokens)
+    VALUES (new.id, new.title, new.url, new.url_tokens);
+END;
+CREATE TRIGGER IF NOT EXISTS urls_fts_delete AFTER DELETE ON urls BEGIN
+    INSERT INTO urls_fts (urls_fts, rowid, title, url, url_tokens)
+    VALUES ('delete', old.id, old.title, old.url, old.url_tokens);
+END;
+CREATE TRIGGER IF NOT EXISTS urls_fts_update AFTER UPDATE OF title, url, url_tokens ON urls BEGIN
+    INSERT INTO urls_fts (urls_fts, rowid, title, url, url_tokens)
+    VALUES ('delete', old.id, old.title, old.url, old.url_tokens);
+    INSERT INTO urls_fts (rowid, title, url, url_tokens)
+    VALUES (new.id, new.title, new.url, new.url_tokens);
+END;
+"""
+
+# bm25() column weights for title, url, url_tokens
+FTS_WEIGHTS = (4.0, 0.5, 2.0)
+
+# Pieces of a URL that say nothing about the page
+URL_NOISE_TOKENS = {"www", "http", "https", "html", "htm", "php", "aspx", "index"}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def domain_of(url: str) -> str:
+    try:
+        host = urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def tokenize_url(url: str) -> str:
+    """
+    Splits a URL into searchable words: host labels plus decoded path and query segments.
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return ""
+    text = " ".join([
+        (parts.hostname or "").replace(".", " "),
+        unquote_plus(parts.path),
+        unquote_plus(parts.query),
+    ])
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token not in URL_NOISE_TOKENS and token not in tokens:
+            tokens.append(token)
+    return " ".join(tokens)
+
+
+def build_match_query(keywords) -> str:
+    """
+    Turns keywords into an FTS5 MATCH expression. Every word is a prefix term and
+    terms are OR-ed, so pages matching more of them rank higher under BM25.
+    """
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    terms = []
+    for keyword in keywords or []:
+        for word in _TOKEN_RE.findall(keyword.lower()):
+            term = f'"{word}"*'
+            if term not in terms:
+                terms.append(term)
+    return " OR ".join(terms)
+
+SYNC_BATCH_SIZE = 5000
+
+
+def encode_cursor(last_visit_time: int, url_id: int) -> str:
+    return f"{last_visit_time}-{url_id}"
+
+
+def decode_cursor(cursor: str):
+    try:
+        last_visit_time, url_id = cursor.split("-")
+        return int(last_visit_time), int(url_id)
+    except ValueError:
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+
+
+class HistoryStore:
+    """
+    Persistent local copy of one browser profile's history (a HistorySource).
+
+    The store ingests only rows that are new since the previous sync, tracked by
+    the urls.id / visits.id / last_visit_time high-water marks, so answering a
+    history question never copies the browser's database.
+
+    Worker processes share the store file. Only one of them syncs at a time,
+    under a file lock; the others keep reading what is already there.
+    """
+
+    def __init__(self, store_path: str, source):
+        self.store_path = store_path
+        self.source = source
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(store_path), mode=0o700, exist_ok=True)
+        self._connect()
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.executescript(
+                "DROP TABLE IF EXISTS urls_fts; DROP TABLE IF EXISTS urls; "
+                "DROP TABLE IF EXISTS visits; DROP TABLE IF EXISTS sync_state;"
+            )
+        self._conn.executescript(SCHEMA)
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logging.warning("SQLite FTS5 unavailable (%s); falling back to LIKE search", e)
+            self.fts_enabled = False
+
+        # SQLite connections must not cross fork(); preforked workers each open their own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.store_path, timeout=STORE_BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._connect()
+
+    # --- High-water marks ---
+    def _get_state(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_state(self, key: str, value: int):
+        self._conn.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    @property
+    def generation(self) -> int:
+        """
+        Bumped every time the store is rebuilt, so derived indexes know to start over.
+        """
+        with self._lock:
+            return self._get_state("generation")
+
+    def _reset(self):
+        logging.info("Browser history was cleared or replaced; rebuilding %s", self.store_path)
+        generation = self._get_state("generation")
+        self._conn.execute("DELETE FROM urls")
+        self._conn.execute("DELETE FROM visits")
+        self._conn.execute("DELETE FROM sync_state")
+        self._set_state("generation", generation + 1)
+
+    # --- Ingestion ---
+    def sync(self) -> int:
+        """
+        Pulls new urls/visits rows from the browser database into the store.
+        Returns the number of visits ingested.
+
+        While another process is syncing, a store that already holds history is
+        read as is; an empty one waits for that sync to finish.
+        """
+        with self._lock, open(self.store_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if self._get_state("max_visit_id"):
+                        logging.debug("%s is being synced by another process", self.store_path)
+                        return 0
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # The lock is released when the file is closed
+            with history_reader.connection(self.source.path) as source:
+                return self._sync_from(source)
+
+    def _sync_from(self, source: sqlite3.Connection) -> int:
+        # Rows are read only past the high-water marks; see HistorySource for the SQL
+        max_url_id, max_visit_id = source.execute(self.source.MAX_IDS_SQL).fetchone()
+        max_url_id, max_visit_id = max_url_id or 0, max_visit_id or 0
+
+        url_mark = self._get_state("max_url_id")
+        visit_mark = self._get_state("max_visit_id")
+        if max_url_id < url_mark or max_visit_id < visit_mark:
+            self._reset()
+            url_mark = visit_mark = 0
+        elif max_url_id == url_mark and max_visit_id == visit_mark:
+            self._purge_deleted(source)
+            return 0
+
+        with self._conn:
+            cursor = source.execute(self.source.URLS_SQL, (url_mark, visit_mark))
+            while True:
+                rows = cursor.fetchmany(SYNC_BATCH_SIZE)
+                if not rows:
+                    break
+                # Upsert rather than REPLACE so the FTS update trigger fires
+                self._conn.executemany(
+                    "INSERT INTO urls (id, url, title, url_tokens, domain, visit_count, last_visit_time) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET url = excluded.url, title = excluded.title, "
+                    "url_tokens = excluded.url_tokens, domain = excluded.domain, "
+                    "visit_count = excluded.visit_count, last_visit_time = excluded.last_visit_time",
+                    (
+                        (url_id, url, title, tokenize_url(url), domain_of(url), visit_count, last_visit_time)
+                        for url_id, url, title, visit_count, last_visit_time in rows
+                    ),
+                )
+
+            ingested = 0
+            cursor = source.execute(self.source.VISITS_SQL, (visit_mark,))
+            while True:
+                rows = cursor.fetchmany(SYNC_BATCH_SIZE)
+                if not rows:
+                    break
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO visits "
+                    "(id, url_id, visit_time, from_visit, transition, visit_duration) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                ingested += len(rows)
+
+            last_visit_mark = self._conn.execute("SELECT MAX(last_visit_time) FROM urls").fetchone()[0]
+            self._set_state("max_url_id", max_url_id)
+            self._set_state("max_visit_id", max_visit_id)
+            self._set_state("max_last_visit_time", last_visit_mark or 0)
+
+        logging.debug("Ingested %d new visits into %s", ingested, self.store_path)
+        self._purge_deleted(source)
+        return ingested
+
+    def _purge_deleted(self, source: sqlite3.Connection) -> int:
+        """
+        Removes rows the user deleted in the browser (single entries, "delete older
+        than", ranges) that the high-water marks can't see. Row counts are compared
+        on every sync; only when the store holds more than the browser are the live
+        ids read to find which rows went. Returns the number of visits removed.
+        """
+        source_urls, source_visits = source.execute(self.source.COUNTS_SQL).fetchone()
+        store_urls, store_visits = self._conn.execute(
+            "SELECT (SELECT COUNT(*) FROM urls), (SELECT COUNT(*) FROM visits)"
+        ).fetchone()
+        if store_urls <= source_urls and store_visits <= source_visits:
+            return 0
+
+        logging.info("History was deleted in %s; removing it from %s", self.source.label, self.store_path)
+        with self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_ids (id INTEGER PRIMARY KEY)")
+            removed = 0
+            for table, ids_sql in (("visits", self.source.VISIT_IDS_SQL), ("urls", self.source.URL_IDS_SQL)):
+                self._conn.execute("DELETE FROM temp.live_ids")
+                cursor = source.execute(ids_sql)
+                while True:
+                    rows = cursor.fetchmany(SYNC_BATCH_SIZE)
+                    if not rows:
+                        break
+                    self._conn.executemany("INSERT INTO temp.live_ids (id) VALUES (?)", rows)
+                if table == "visits":
+                    # Urls that keep some visits fall back to their latest remaining one
+                    self._conn.execute(
+                        "CREATE TEMP TABLE IF NOT EXISTS touched_urls (id INTEGER PRIMARY KEY)"
+                    )
+                    self._conn.execute("DELETE FROM temp.touched_urls")
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO temp.touched_urls "
+                        "SELECT url_id FROM visits WHERE id NOT IN (SELECT id FROM temp.live_ids)"
+                    )
+                    removed = self._conn.execute(
+                        "DELETE FROM visits WHERE id NOT IN (SELECT id FROM temp.live_ids)"
+                    ).rowcount
+                else:
+                    self._conn.execute("DELETE FROM urls WHERE id NOT IN (SELECT id FROM temp.live_ids)")
+            self._conn.execute(
+                "UPDATE urls SET last_visit_time = "
+                "COALESCE((SELECT MAX(visit_time) FROM visits WHERE url_id = urls.id), last_visit_time) "
+                "WHERE id IN (SELECT id FROM temp.touched_urls)"
+            )
+            self._conn.execute("DELETE FROM temp.live_ids")
+            self._conn.execute("DELETE FROM temp.touched_urls")
+            # Derived indexes may still hold the deleted pages, so they start over
+            self._set_state("generation", self._get_state("generation") + 1)
+        return removed
+
+    # --- Queries ---
+    def _filters(self, keywords, start_time, end_time):
+        """
+        Builds the FROM clause, WHERE conditions and params shared by search() and page(),
+        and the column holding each row's visit time.
+
+        With an end time, a row's time is its latest visit inside the range rather than
+        urls.last_visit_time, so "yesterday" lists, orders and pages by yesterday's visits.
+        """
+        conditions = []
+        params = []
+        match_query = build_match_query(keywords)
+        use_fts = bool(match_query) and self.fts_enabled
+
+        source = "urls_fts JOIN urls ON urls.id = urls_fts.rowid" if use_fts else "urls"
+        visit_time = "urls.last_visit_time"
+        if end_time is not None:
+            source += (
+                " JOIN (SELECT url_id, MAX(visit_time) AS visit_time FROM visits"
+                " WHERE visit_time >= ? AND visit_time < ? GROUP BY url_id) AS ranged"
+                " ON ranged.url_id = urls.id"
+            )
+            params.extend([start_time or 0, end_time])
+            visit_time = "ranged.visit_time"
+
+        if use_fts:
+            conditions.append("urls_fts MATCH ?")
+            params.append(match_query)
+        else:
+            words = [term.strip('"*') for term in match_query.split(" OR ")] if match_query else []
+            if words:
+                conditions.append("(" + " OR ".join(["title LIKE ? OR url LIKE ?"] * len(words)) + ")")
+                for word in words:
+                    params.extend([f"%{word}%", f"%{word}%"])
+
+        # Open-ended ranges only need each url's latest visit, which the urls index covers
+        if start_time is not None and end_time is None:
+            conditions.append("urls.last_visit_time >= ?")
+            params.append(start_time)
+
+        return source, conditions, params, use_fts, visit_time
+
+    def search(self, keywords=None, start_time=None, end_time=None, limit=None):
+        """
+        Returns (url, title, visit_time) rows, where visit_time is the latest visit in
+        range. With keywords the rows are BM25-ranked full-text matches, otherwise
+        they are newest first. start_time / end_time are WebKit timestamps.
+        """
+        source, conditions, params, use_fts, visit_time = self._filters(keywords, start_time, end_time)
+        query = f"SELECT urls.url, urls.title, {visit_time} FROM {source}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        if use_fts:
+            query += " ORDER BY bm25(urls_fts, ?, ?, ?)"
+            params.extend(FTS_WEIGHTS)
+        else:
+            query += f" ORDER BY {visit_time} DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def keyset_page(self, keywords=None, start_time=None, end_time=None, before=None, limit=50):
+        """
+        Returns up to `limit` (id, url, title, visit_time) rows, newest first,
+        strictly older than the `before` (visit_time, id) key.
+
+        Pagination is keyset-based, so each page is an index range scan no matter
+        how deep into the history it is.
+        """
+        source, conditions, params, _, visit_time = self._filters(keywords, start_time, end_time)
+        if before:
+            conditions.append(f"({visit_time}, urls.id) < (?, ?)")
+            params.extend(before)
+
+        query = f"SELECT urls.id, urls.url, urls.title, {visit_time} FROM {source}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {visit_time} DESC, urls.id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def page(self, keywords=None, start_time=None, end_time=None, cursor=None, limit=50):
+        """
+        Returns one page of (url, title, last_visit_time) rows, newest first, and
+        the cursor for the next page (None on the last page).
+        """
+        before = decode_cursor(cursor) if cursor else None
+        rows = self.keyset_page(keywords, start_time, end_time, before=before, limit=limit + 1)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            url_id, _, _, last_visit_time = rows[-1]
+            next_cursor = encode_cursor(last_visit_time, url_id)
+        return [row[1:] for row in rows], next_cursor
+
+    def iter_rows(self, keywords=None, start_time=None, end_time=None, page_size=200):
+        """
+        Yields every matching row, newest first, one page at a time.
+        """
+        cursor = None
+        while True:
+            rows, cursor = self.page(keywords, start_time, end_time, cursor=cursor, limit=page_size)
+            yield from rows
+            if cursor is None:
+                return
+
+    # --- Bulk reads for analytics ---
+    def _visit_range(self, start_time, end_time):
+        conditions = []
+        params = []
+        if start_time is not None:
+            conditions.append("visit_time >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("visit_time < ?")
+            params.append(end_time)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def visit_columns(self, start_time=None, end_time=None):
+        """
+        Returns (visit_time, visit_duration, url_id) rows for every visit in range, oldest first.
+        """
+        where, params = self._visit_range(start_time, end_time)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT visit_time, visit_duration, url_id FROM visits{where} ORDER BY visit_time",
+                params,
+            ).fetchall()
+
+    def visited_domains(self, start_time=None, end_time=None):
+        """
+        Returns (id, domain) for every url with a visit in range.
+        """
+        where, params = self._visit_range(start_time, end_time)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT id, domain FROM urls WHERE id IN (SELECT url_id FROM visits{where})", params
+            ).fetchall()
+
+    def visited_url_ids(self, start_time=None, end_time=None):
+        """
+        Returns the ids of urls with a visit in range.
+        """
+        where, params = self._visit_range(start_time, end_time)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT DISTINCT url_id FROM visits{where}", params)]
+
+    def visit_pages(self, start_time, end_time, limit=-1):
+        """
+        Returns (visit_id, url, title, domain) for visits in [start_time, end_time],
+        oldest first; with `limit`, only the first that many.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT visits.id, urls.url, urls.title, urls.domain FROM visits "
+                "JOIN urls ON urls.id = visits.url_id "
+                "WHERE visit_time >= ? AND visit_time <= ? ORDER BY visit_time, visits.id LIMIT ?",
+                (start_time, end_time, limit),
+            ).fetchall()
+
+    # --- Reads for derived indexes ---
+    def visits_after(self, visit_id=0, limit=SYNC_BATCH_SIZE):
+        """
+        Returns up to `limit` (id, visit_time, from_visit, visit_duration, domain) rows
+        for visits past `visit_id`, in id order.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT visits.id, visit_time, from_visit, visit_duration, urls.domain FROM visits "
+                "JOIN urls ON urls.id = visits.url_id WHERE visits.id > ? ORDER BY visits.id LIMIT ?",
+                (visit_id, limit),
+            ).fetchall()
+
+    def changed_urls(self, after=(0, 0), limit=SYNC_BATCH_SIZE):
+        """
+        Returns up to `limit` (id, title, url_tokens, domain, last_visit_time) rows
+        past the (last_visit_time, id) mark `after`, oldest first. Revisited urls
+        move past the mark again, so repeated calls see every new or changed url.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, title, url_tokens, domain, last_visit_time FROM urls "
+                "WHERE (last_visit_time, id) > (?, ?) ORDER BY last_visit_time, id LIMIT ?",
+                (*after, limit),
+            ).fetchall()
+
+    def urls_by_id(self, ids, start_time=None, end_time=None):
+        """
+        Returns {id: (url, title, last_visit_time)} for the given url ids. With an end
+        time, the time is each url's latest visit in [start_time, end_time).
+        """
+        ids = list(ids)
+        placeholders = ",".join("?" * len(ids))
+        if end_time is None:
+            query = f"SELECT id, url, title, last_visit_time FROM urls WHERE id IN ({placeholders})"
+            params = ids
+        else:
+            query = (
+                "SELECT urls.id, urls.url, urls.title, MAX(visits.visit_time) FROM urls "
+                "JOIN visits ON visits.url_id = urls.id "
+                f"WHERE urls.id IN ({placeholders}) AND visit_time >= ? AND visit_time < ? GROUP BY urls.id"
+            )
+            params = ids + [start_time or 0, end_time]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall() if ids else []
+        return {url_id: (url, title, last_visit_time) for url_id, url, title, last_visit_time in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(source) -> HistoryStore:
+    """
+    Returns the shared store for a browser profile, creating it on first use.
+    """
+    with _stores_lock:
+        store = _stores.get(source.name)
+        if store is None:
+            store = HistoryStore(os.path.join(HISTORY_STORE_DIR, f"{source.name}.db"), source)
+            _stores[source.name] = store
+        return store
@@ -0,0 +1,225 @@
+import os
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import registry, Gauge
+
+DUCKDUCKGO_URL = os.environ.get("DUCKDUCKGO_URL", "https://api.duckduckgo.com/")
+
+# Connect / read timeouts (seconds) for outbound lookups
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "4"))
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+
+# Retries: at most MAX_RETRIES per call, and retries overall capped at RETRY_BUDGET
+# of requests so a struggling backend isn't hit with a retry storm
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+RETRY_BUDGET = float(os.environ.get("HTTP_RETRY_BUDGET", "0.2"))
+RETRY_BACKOFF = 0.1
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Circuit breaker: after this many consecutive failures the backend is skipped for COOLDOWN seconds
+BREAKER_THRESHOLD = int(os.environ.get("HTTP_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("HTTP_BREAKER_COOLDOWN", "30"))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryBudget:
+    """
+    Allows retries only while they stay under `ratio` of recent requests. The
+    counts decay by half every `window` seconds.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET, window=10.0, min_retries=3):
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._requests = 0.0
+        self._retries = 0.0
+        self._decayed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decay(self):
+        now = time.monotonic()
+        while now - self._decayed_at >= self.window:
+            self._requests /= 2
+            self._retries /= 2
+            self._decayed_at += self.window
+
+    def record_request(self):
+        with self._lock:
+            self._decay()
+            self._requests += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._decay()
+            if self._retries < self.min_retries or self._retries < self._requests * self.ratio:
+                self._retries += 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures. While open every call
+    fails fast; after `cooldown` a single trial call is let through (half-open),
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class Backend:
+    """
+    One outbound lookup service: a pooled keep-alive session plus its own retry
+    budget and circuit breaker. New lookup backends should get one via get_backend().
+    """
+
+    def __init__(self, name: str, base_url: str, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries=MAX_RETRIES):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "ddc-chatbot"
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, path: str = "", params=None, deadline=None) -> requests.Response:
+        """
+        GETs base_url + path with encoded `params`. Retries connection errors and
+        retryable statuses with jittered backoff while the retry budget and the
+        optional absolute `deadline` (time.monotonic()) allow.
+        Raises CircuitOpenError without a request while the breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+
+        self.budget.record_request()
+        url = self.base_url + path
+        attempt = 0
+        succeeded = False
+        try:
+            while True:
+                timeout = self.timeout
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise requests.Timeout(f"{self.name} deadline exceeded")
+                    timeout = (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+
+                try:
+                    response = self.session.get(url, params=params, timeout=timeout)
+                    if response.status_code not in RETRY_STATUSES:
+                        succeeded = True
+                        return response
+                    # Hand the connection back to the pool before retrying
+                    response.close()
+                    error = requests.HTTPError(f"{self.name} returned {response.status_code}", response=response)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+
+                attempt += 1
+                if attempt > self.max_retries or not self.budget.try_spend():
+                    raise error
+
+                # Full jitter: sleep somewhere in [0, backoff * 2^attempt)
+                delay = random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise error
+                logging.debug("Retrying %s after %s (attempt %d)", self.name, error, attempt)
+                time.sleep(delay)
+        finally:
+            # Every way out counts, so a half-open trial can never be left in flight
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def close(self):
+        self.session.close()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str, base_url: str, **kwargs) -> Backend:
+    """
+    Returns the shared Backend for `name`, creating it on first use.
+    """
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = _backends[name] = Backend(name, base_url, **kwargs)
+        return backend
+
+
+def breaker_states() -> dict:
+    with _backends_lock:
+        return {name: backend.breaker.state for name, backend in _backends.items()}
+
+
+BREAKER_STATES = ("closed", "half-open", "open")
+
+registry.register(Gauge(
+    "chatbot_backend_circuit_state", "Circuit breaker state per outbound backend (1 for the current state).",
+    ["backend", "state"],
+    lambda: {
+        (name, state): int(state == current)
+        for name, current in breaker_states().items() for state in BREAKER_STATES
+    },
+))
@@ -0,0 +1,109 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+KeywordHit = namedtuple("KeywordHit", ["keyword", "category", "start", "end"])
+
+# Distinct query strings whose classification is kept
+MATCH_CACHE_SIZE = 4096
+
+_WORD_CHAR = re.compile(r"\w")
+
+
+def normalize(text: str) -> str:
+    # Keyword lists mix straight and curly apostrophes
+    return text.lower().replace("’", "'").replace("‘", "'")
+
+
+def _trie_pattern(words) -> str:
+    """
+    Builds a regex alternation shaped like a trie, so matching at any position
+    costs at most the length of the longest keyword regardless of how many
+    keywords there are. Optional suffixes are greedy: longer keywords win.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+class QueryMatch:
+    """
+    Every keyword hit in one query, plus the set of categories they belong to.
+    """
+
+    __slots__ = ("hits", "categories")
+
+    def __init__(self, hits):
+        self.hits = tuple(hits)
+        self.categories = frozenset(hit.category for hit in self.hits)
+
+    def has(self, category: str) -> bool:
+        return category in self.categories
+
+    def keywords(self, category: str):
+        return [hit.keyword for hit in self.hits if hit.category == category]
+
+    def __repr__(self):
+        return f"QueryMatch({sorted(self.categories)})"
+
+
+class KeywordMatcher:
+    """
+    Classifies text against several keyword lists in a single pass.
+
+    All keywords are compiled into one trie-shaped regex when the matcher is
+    built. Keywords only match on word boundaries ("vs" does not match inside
+    "canvas", "how" does not match inside "show"), and overlapping keywords are
+    all reported ("go deeper" also yields "deeper").
+    """
+
+    def __init__(self, categories: dict):
+        self._categories = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                keyword = normalize(keyword.strip())
+                if keyword:
+                    self._categories.setdefault(keyword, [])
+                    if category not in self._categories[keyword]:
+                        self._categories[keyword].append(category)
+
+        # The regex reports the longest keyword at each position; shorter keywords that
+        # end on a word boundary inside it ("tell me" in "tell me more") are added here.
+        self._expansions = {}
+        for keyword in self._categories:
+            expansion = []
+            for end in range(1, len(keyword) + 1):
+                prefix = keyword[:end]
+                at_boundary = end == len(keyword) or not (
+                    _WORD_CHAR.match(keyword[end]) and _WORD_CHAR.match(keyword[end - 1])
+                )
+                if at_boundary and prefix in self._categories:
+                    expansion.extend((prefix, category) for category in self._categories[prefix])
+            self._expansions[keyword] = tuple(expansion)
+
+        pattern = _trie_pattern(self._categories) if self._categories else "(?!)"
+        self._regex = re.compile(rf"(?=(?<!\w)({pattern})(?!\w))")
+        self.match = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match)
+
+    def _match(self, text: str) -> QueryMatch:
+        hits = []
+        for found in self._regex.finditer(normalize(text)):
+            start = found.start(1)
+            for keyword, category in self._expansions[found.group(1)]:
+                hits.append(KeywordHit(keyword, category, start, start + len(keyword)))
+        return QueryMatch(hits)
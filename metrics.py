@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# With a directory set, every process writes its counters and histograms there and /metrics
+# adds them all up, so any gunicorn worker can answer a scrape; see gunicorn.conf.py
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+
+# Upper bounds (seconds) of the latency buckets; spans range from cached lookups to Gemini calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total: dict, samples: dict):
+        for key, value in samples.items():
+            total[key] = total.get(key, 0) + value
+
+    def collect(self, values=None):
+        values = self.samples() if values is None else values
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus layout; observe() is a
+    binary search and an increment under a lock.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def reset(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> dict:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    @staticmethod
+    def merge(total: dict, samples: dict):
+        for key, series in samples.items():
+            if key in total:
+                total[key] = [a + b for a, b in zip(total[key], series)]
+            else:
+                total[key] = list(series)
+
+    def collect(self, snapshot=None):
+        snapshot = self.samples() if snapshot is None else snapshot
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """
+    Values read when metrics are rendered: `source` returns a dict of label values -> value.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames, source):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.source = source
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for key, value in sorted(self.source().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Registry:
+    """
+    The metrics served by /metrics. With a `directory`, counters and histograms
+    are written there by every process, at most `flush_interval` seconds stale,
+    and rendered as the sum over all processes. Gauges always describe the
+    process that renders them.
+    """
+
+    def __init__(self, directory=None, flush_interval=METRICS_FLUSH_INTERVAL):
+        self._metrics = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._start_flusher()
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _after_fork(self):
+        # A worker counts only its own requests; whatever the master recorded stays in its file
+        for metric in self._metrics:
+            if hasattr(metric, "reset"):
+                metric.reset()
+        self._start_flusher()
+
+    def _start_flusher(self):
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    logging.warning("Writing metrics to %s failed: %s", self.directory, e)
+
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+    def flush(self):
+        """
+        Writes this process's counters and histograms to its file in the directory.
+        """
+        state = {
+            metric.name: [[list(key), value] for key, value in metric.samples().items()]
+            for metric in self._metrics if hasattr(metric, "samples")
+        }
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def _aggregate(self) -> dict:
+        # Files of exited workers are kept, so counters never go backwards
+        self.flush()
+        totals = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric in self._metrics:
+                if metric.name in state:
+                    samples = {tuple(key): value for key, value in state[metric.name]}
+                    metric.merge(totals.setdefault(metric.name, {}), samples)
+        return totals
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        totals = self._aggregate() if self.directory else {}
+        lines = []
+        for metric in self._metrics:
+            if metric.name in totals:
+                lines.extend(metric.collect(totals[metric.name]))
+            else:
+                lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(METRICS_DIR)
+
+stage_seconds = registry.register(Histogram(
+    "chatbot_stage_seconds", "Time spent in each stage of answering a request.", ["stage"]
+))
+stage_errors = registry.register(Counter(
+    "chatbot_stage_errors_total", "Stages that ended with an exception.", ["stage"]
+))
+request_seconds = registry.register(Histogram(
+    "chatbot_request_seconds", "Time until the response headers were ready, per endpoint.", ["endpoint"]
+))
+requests_total = registry.register(Counter(
+    "chatbot_requests_total", "Requests served, per endpoint and status code.", ["endpoint", "status"]
+))
+answers_total = registry.register(Counter(
+    "chatbot_answers_total", "General answers, per source (cache, duckduckgo, gemini).", ["source"]
+))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times the block into chatbot_stage_seconds{stage=...}, counting it as an error if it raises.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # A client closing a stream is not a failure of the stage
+        if not isinstance(e, GeneratorExit):
+            stage_errors.inc(stage=stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+def timed(stage: str):
+    """
+    Decorator form of span().
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
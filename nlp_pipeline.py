@@ -0,0 +1,114 @@
+import os
+import logging
+import threading
+from collections import namedtuple
+
+import spacy
+from cachetools import LRUCache
+
+SPACY_MODEL = os.environ.get("SPACY_MODEL", "en_core_web_sm")
+
+# Query analysis only needs tokenization, stop words and NER
+EXCLUDED_COMPONENTS = ["parser", "senter", "tagger", "attribute_ruler", "lemmatizer"]
+
+# Analyses of distinct queries (as typed, whitespace aside) kept in memory
+ANALYSIS_CACHE_SIZE = int(os.environ.get("NLP_CACHE_SIZE", "2048"))
+
+PIPE_BATCH_SIZE = 64
+
+# Plain tuples rather than spaCy Docs, so cached entries are small and safe to share
+Token = namedtuple("Token", ["text", "lower", "i", "is_alpha", "is_stop"])
+Entity = namedtuple("Entity", ["text", "label", "start", "end"])
+Analysis = namedtuple("Analysis", ["tokens", "entities"])
+
+_nlp = None
+_load_lock = threading.Lock()
+_ready = threading.Event()
+
+_cache = LRUCache(maxsize=ANALYSIS_CACHE_SIZE)
+_cache_lock = threading.Lock()
+
+
+def get_nlp():
+    """
+    Returns the trimmed spaCy pipeline, loading it on first use.
+    """
+    global _nlp
+    if _nlp is None:
+        with _load_lock:
+            if _nlp is None:
+                logging.info("Loading spaCy model %s (excluding %s)", SPACY_MODEL, EXCLUDED_COMPONENTS)
+                _nlp = spacy.load(SPACY_MODEL, exclude=EXCLUDED_COMPONENTS)
+                _ready.set()
+    return _nlp
+
+
+def warm_up(background: bool = False):
+    """
+    Loads the model now, or in a daemon thread so startup doesn't wait for it.
+    """
+    if background:
+        threading.Thread(target=get_nlp, name="spacy-warmup", daemon=True).start()
+    else:
+        get_nlp()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _clean(text: str) -> str:
+    # NER relies on capitalization, so the model sees the query as typed, minus extra whitespace
+    return " ".join(text.split())
+
+
+def _to_analysis(doc) -> Analysis:
+    return Analysis(
+        tokens=tuple(Token(token.text, token.lower_, token.i, token.is_alpha, token.is_stop) for token in doc),
+        entities=tuple(Entity(ent.text, ent.label_, ent.start, ent.end) for ent in doc.ents),
+    )
+
+
+def analyze(text: str) -> Analysis:
+    """
+    Tokens and entities for a query; repeated queries come from the cache. The
+    cache is keyed case-sensitively, since NER results depend on capitalization.
+    """
+    key = _clean(text)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    analysis = _to_analysis(get_nlp()(key))
+    with _cache_lock:
+        _cache[key] = analysis
+    return analysis
+
+
+def analyze_batch(texts) -> list:
+    """
+    Analyzes many queries at once; cache misses go through a single nlp.pipe call.
+    Results are in the same order as `texts`.
+    """
+    keys = [_clean(text) for text in texts]
+    results = {}
+    with _cache_lock:
+        for key in keys:
+            cached = _cache.get(key)
+            if cached is not None:
+                results[key] = cached
+
+    missing = list(dict.fromkeys(key for key in keys if key not in results))
+    if missing:
+        for key, doc in zip(missing, get_nlp().pipe(missing, batch_size=PIPE_BATCH_SIZE)):
+            results[key] = _to_analysis(doc)
+        with _cache_lock:
+            for key in missing:
+                _cache[key] = results[key]
+
+    return [results[key] for key in keys]
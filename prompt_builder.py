@@ -0,0 +1,229 @@
+import os
+import re
+import random
+
+# Rough size of the whole prompt, in tokens, that build_prompt stays under
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1200"))
+
+# Most recent turns are quoted verbatim; anything older lives in the rolling summary
+RECENT_TURNS = int(os.environ.get("PROMPT_RECENT_TURNS", "4"))
+
+# Ceilings for the rolling summary and for any single quoted answer
+SUMMARY_TOKEN_BUDGET = 250
+TURN_TOKEN_BUDGET = 200
+
+# Gemini averages about four characters of English per token
+CHARS_PER_TOKEN = 4
+
+_MARKDOWN = re.compile(r"[*_`#>]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+# --- Greeting & Side Notes ---
+greeting = [
+    "Hey there! 😊",
+    "Hi! What’s on your mind today?",
+    "Hello! Ready to explore something new?",
+    "Yo! Got a question for me?",
+    "Hey! Curious about something?",
+    "Hi there! What can I help you with?",
+    "Welcome! What’s up?",
+]
+
+side_note = [
+    "By the way, you asked a great question!",
+    "Fun fact: this comes up a lot in interesting discussions!",
+    "You're diving into a pretty cool topic.",
+    "People don’t ask this enough — well done.",
+    "This is one of those questions I love getting!",
+    "I genuinely appreciate your quriosity!"
+]
+
+follow_up = {
+    "explore": [
+        "Would you like to explore this further?",
+        "Want me to break it down more?",
+        "Should I expand on that?",
+        "Would a detailed explanation help here?",
+        "Curious about the 'why' behind this?",
+        "Would a deeper dive into this topic help?",
+        "Shall I walk you through this step-by-step?",
+    ],
+    "examples": [
+        "Need an example to make it clearer?",
+        "Shall I walk you through a sample scenario?",
+        "Would a real-world analogy help here?",
+        "Would you like a visual or analogy to understand it better?",
+        "Want to hear how this works in real life?",
+        "Should I explain this like you're five?",
+    ],
+    "connections": [
+        "Want to know how this connects to something bigger?",
+        "Would you like the advanced version of this?",
+        "Want me to show how this works with real data?",
+        "Want a nerdy detail? I’ve got one.",
+        "Feeling curious? I can go on!",
+        "Want to geek out on this a bit more?"
+    ],
+    "decisions": [
+        "Would it help if I listed pros and cons?",
+        "Need help choosing between similar options?",
+        "Want help choosing between options?",
+        "Should I compare a few approaches?",
+        "Shall I summarize the key takeaways?",
+    ],
+    "style_variation": [
+        "Want to hear the quick version and then the in-depth one?",
+        "Would you prefer a comparison to something familiar?",
+        "Want me to explain it like a story?",
+        "Would you like a more casual or formal explanation?",
+    ],
+    "friendly": [
+        "Want to keep chatting about this?",
+        "Would you like a fun fact connected to this?",
+        "Having fun? Want more of this?",
+        "This is exciting right? Want to know more?",
+        "Are you loving the conversation so far?"
+    ]
+}
+
+# Follow-up suggestion list used for each detect_intent() result
+INTENT_FOLLOW_UPS = {
+    "compare": "decisions",
+    "examples": "examples",
+    "connections": "connections",
+    "explore": "explore",
+    "friendly": "friendly",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)].rsplit(" ", 1)[0] + "…"
+
+
+def compress_turn(turn: dict) -> str:
+    """
+    One summary line for a turn: the question and the first sentence of the answer.
+    """
+    question = " ".join(turn["user_input"].split())
+    answer = " ".join(_MARKDOWN.sub("", turn["bot_response"]).split())
+    answer = _SENTENCE_END.split(answer, 1)[0]
+    return f"- Asked: {truncate_to_tokens(question, 30)} Answered: {truncate_to_tokens(answer, 40)}"
+
+
+def fold_summary(summary: str, history: list) -> str:
+    """
+    Returns the rolling summary to store once the next turn is appended to
+    `history`: the turn that leaves the verbatim window is compressed onto the
+    end, and the oldest lines are dropped to stay within SUMMARY_TOKEN_BUDGET.
+    Each call does one turn's work; the summary is never rebuilt from scratch.
+    """
+    if len(history) < RECENT_TURNS:
+        return summary
+    lines = summary.splitlines() if summary else []
+    lines.append(compress_turn(history[-RECENT_TURNS]))
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def pick_style(intent: str):
+    """
+    One greeting, one follow-up suggestion matching the intent, and one side note.
+    """
+    follow_ups = follow_up[INTENT_FOLLOW_UPS.get(intent, "friendly")]
+    return random.choice(greeting), random.choice(follow_ups), random.choice(side_note)
+
+
+PROMPT_TEMPLATE = """
+You are a friendly and knowledgeable assistant who acts like a smart, human-powered search engine. Think of yourself as a helpful guide — someone who explains concepts clearly, provides useful information quickly, and makes learning feel effortless.
+
+Your job is to:
+- Provide trustworthy, accurate, and digestible information (like an informative book).
+- Sound approachable, curious, and slightly warm (not robotic).
+- Use Markdown formatting (*bold, *italics, bullet points, etc.) to improve clarity.
+- Anticipate what the user might want next, and gently offer follow-up help or suggestions.
+
+*Conversation Context*:
+{context}
+
+*Current User Question*:
+{user_input}
+
+*Tone to use*: {tone}
+
+---
+
+Now generate a response using the following style:
+{style}"""
+
+QUICK_STYLE = """
+Start with a friendly greeting like: "{greeting}" (or something equally warm and welcoming).
+
+Give a brief, clear summary of the topic (2–3 sentences). Keep it informative, but easy to digest.
+
+Wrap up with a follow-up suggestion like: "{follow_up}" if it fits naturally into the flow.
+
+Add a light side comment if appropriate: "{side_note}".
+"""
+
+DEEP_STYLE = """
+This is a follow-up question.
+
+Now provide a more in-depth, structured explanation:
+- Use examples, analogies, or comparisons.
+- Build on prior information without repeating it.
+- Keep the tone friendly, expert, and easy to understand.
+"""
+
+
+def build_prompt(user_input: str, history: list, summary: str, tone: str, intent: str,
+                 is_follow_up: bool, budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """
+    Assembles the Gemini prompt within `budget` tokens: the instructions and the
+    question always fit, then the rolling summary, then as many of the most
+    recent RECENT_TURNS turns as the remaining budget allows (newest first).
+    The question is never shortened; a long one leaves less room for context,
+    and one over budget gets no context at all.
+    """
+    if is_follow_up:
+        style = DEEP_STYLE
+    else:
+        greeting_line, follow_up_line, side_note_line = pick_style(intent)
+        style = QUICK_STYLE.format(greeting=greeting_line, follow_up=follow_up_line, side_note=side_note_line)
+
+    fixed = estimate_tokens(PROMPT_TEMPLATE) + estimate_tokens(style) + estimate_tokens(user_input) + estimate_tokens(tone)
+    remaining = budget - fixed
+
+    parts = []
+    if summary:
+        # Keep the newest summary lines when space is short
+        lines = summary.splitlines()
+        while lines and estimate_tokens("\n".join(lines)) > min(SUMMARY_TOKEN_BUDGET, remaining):
+            lines.pop(0)
+        if lines:
+            parts.append("Earlier in this conversation:\n" + "\n".join(lines))
+            remaining -= estimate_tokens(parts[0])
+
+    recent = []
+    for turn in reversed(history[-RECENT_TURNS:]):
+        text = (
+            f"User: {turn['user_input']}\n"
+            f"Assistant: {truncate_to_tokens(turn['bot_response'], TURN_TOKEN_BUDGET)}"
+        )
+        cost = estimate_tokens(text) + 1
+        if cost > remaining:
+            break
+        recent.append(text)
+        remaining -= cost
+    parts.extend(reversed(recent))
+
+    return PROMPT_TEMPLATE.format(
+        context="\n".join(parts), user_input=user_input, tone=tone, style=style
+    )
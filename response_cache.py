@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+from cachetools import TTLCache
+
+from nlp_pipeline import normalize_query
+
+# In-process tier
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", str(6 * 60 * 60)))
+
+# "I couldn't find a good answer" is cached too, but only briefly so a later retry can do better
+NEGATIVE_CACHE_SIZE = int(os.environ.get("NEGATIVE_CACHE_SIZE", "512"))
+NEGATIVE_CACHE_TTL = float(os.environ.get("NEGATIVE_CACHE_TTL", str(10 * 60)))
+
+# Optional on-disk tier that survives restarts; unset to keep the cache in memory only
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
+
+# Expired disk rows are purged every this many writes
+DISK_PURGE_INTERVAL = 500
+
+DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    negative INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_expires_at ON responses(expires_at);
+"""
+
+
+def make_key(backend: str, query: str, tone: str = "", intent: str = "") -> str:
+    """
+    Cache key for one backend's answer to a normalized query in a given tone and intent.
+    """
+    normalized = normalize_query(query).rstrip("?!. ")
+    return hashlib.sha1(f"{backend}\x1f{normalized}\x1f{tone}\x1f{intent}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier answer cache: a TTL/LRU dict in process, backed by an optional SQLite
+    file shared across restarts (and worker processes). Negative answers live in
+    their own tier with a shorter TTL.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 negative_maxsize=NEGATIVE_CACHE_SIZE, negative_ttl=NEGATIVE_CACHE_TTL,
+                 disk_path=RESPONSE_CACHE_PATH):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._positive = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._negative = TTLCache(maxsize=negative_maxsize, ttl=negative_ttl)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+        self.disk_path = disk_path
+        self._disk = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._open_disk()
+            # SQLite connections must not cross fork(); preforked workers each open their own
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _open_disk(self):
+        self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.executescript(DISK_SCHEMA)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._open_disk()
+
+    def get(self, key: str):
+        """
+        Returns the cached answer or None.
+        """
+        with self._lock:
+            value = self._positive.get(key)
+            if value is not None:
+                self._counts["memory_hits"] += 1
+                return value
+            value = self._negative.get(key)
+            if value is not None:
+                self._counts["memory_hits"] += 1
+                self._counts["negative_hits"] += 1
+                return value
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT response, negative, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+                if row:
+                    response, negative, _ = row
+                    # Promote to memory; the in-process TTL restarts, which is at most one extra TTL
+                    (self._negative if negative else self._positive)[key] = response
+                    self._counts["disk_hits"] += 1
+                    if negative:
+                        self._counts["negative_hits"] += 1
+                    return response
+
+            self._counts["misses"] += 1
+            return None
+
+    def set(self, key: str, response: str, negative: bool = False):
+        with self._lock:
+            (self._negative if negative else self._positive)[key] = response
+            self._counts["negative_stores" if negative else "stores"] += 1
+
+            if self._disk is not None:
+                ttl = self.negative_ttl if negative else self.ttl
+                try:
+                    with self._disk:
+                        self._disk.execute(
+                            "INSERT OR REPLACE INTO responses (key, response, negative, expires_at) "
+                            "VALUES (?, ?, ?, ?)",
+                            (key, response, int(negative), time.time() + ttl),
+                        )
+                        writes = self._counts["stores"] + self._counts["negative_stores"]
+                        if writes % DISK_PURGE_INTERVAL == 0:
+                            self._disk.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                except sqlite3.Error as e:
+                    logging.warning("Response cache disk write failed: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            counts["memory_entries"] = len(self._positive)
+            counts["negative_entries"] = len(self._negative)
+        lookups = counts.get("memory_hits", 0) + counts.get("disk_hits", 0) + counts.get("misses", 0)
+        counts["hit_rate"] = round(
+            (counts.get("memory_hits", 0) + counts.get("disk_hits", 0)) / lookups, 4
+        ) if lookups else 0.0
+        return counts
+
+    def clear(self):
+        with self._lock:
+            self._positive.clear()
+            self._negative.clear()
+            if self._disk is not None:
+                with self._disk:
+                    self._disk.execute("DELETE FROM responses")
+
+
+# Shared by every request in the process
+response_cache = ResponseCache()
@@ -1,18 +1,22 @@
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
-import random
-import requests
-import sqlite3
-from datetime import datetime, timedelta
+import time
 import logging
-import shutil
-import tempfile
 from flask import session
-import spacy
-
-# Load SpaCy language model
-nlp = spacy.load("en_core_web_sm")
+from nlp_pipeline import analyze, analyze_batch, normalize_query
+from keyword_matcher import KeywordMatcher
+from answer_pipeline import first_good_answer, first_good_stream, map_concurrently, DDG_TIMEOUT, GEMINI_TIMEOUT
+from http_client import get_backend, DUCKDUCKGO_URL
+from conversation_store import conversation_store
+from prompt_builder import build_prompt, fold_summary
+from metrics import span, timed, stage_seconds, stage_errors, answers_total
+from response_cache import response_cache, make_key as make_cache_key
+from history_engine import history_engine
+from history_analytics import analyze_history
+from history_sessions import answer_sessions
+from history_store import webkit_to_datetime
+from date_resolver import DateRange, DATE_WORDS, resolve_date_range, to_webkit_range
 
 # Define history-related intents and keywords
 # These keywords are used to identify if the user is asking about their browser history
@@ -21,39 +25,82 @@ history_keywords = [
     "last week", "yesterday", "today", "past searches", "recent activity"
 ]
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Questions about browsing habits rather than specific pages go to history analytics
+analytics_keywords = [
+    "top domains", "top sites", "most visited sites", "most visited websites", "browsing habits",
+    "browsing stats", "browsing heatmap", "browsing activity", "visits per hour", "visits by hour",
+    "visits per day", "visits by day", "visits per weekday", "browsing per hour", "browsing by hour"
+]
+
+# Time and frequency phrasing that is only about browsing when the question is anchored
+# to the user's own history ("how much time did I spend", "sites per hour")
+analytics_measure_keywords = [
+    "most visited", "most time", "time spent", "how much time", "how long", "per hour",
+    "hour of day", "heatmap", "busiest", "activity by"
+]
+history_anchor_keywords = [
+    "did i spend", "do i spend", "have i spent", "i spent", "i spend", "my time", "did i visit",
+    "do i visit", "i visited", "i visit", "my visits", "i browse", "i browsed", "my browsing", "my history",
+    "browsing", "sites", "websites", "domains", "tabs", "online"
+]
+
+# Questions about what the user was doing over a stretch of time go to browsing sessions
+sessions_keywords = [
+    "what was i researching", "what was i working on", "what have i been researching",
+    "what have i been working on", "what i was researching", "what i was working on", "what was i doing", "what was i reading", "what was i looking at",
+    "what was i up to", "browsing session", "browsing sessions", "rabbit hole", "down the rabbit hole"
+]
+
+# Words that describe the history question itself rather than what the user looked at
+history_filler_words = {
+    word for keyword in history_keywords for word in keyword.lower().split()
+} | {
+    "browser", "browsing", "visit", "visited", "read", "saw", "seen", "site", "sites",
+    "page", "pages", "show", "tell", "search", "searched", "looked", "opened",
+    "article", "articles", "post", "thing", "stuff"
+}
+
+# Configure logging; LOG_LEVEL=DEBUG for the per-step messages
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 load_dotenv()
 
-model = genai.GenerativeModel("gemini-1.5-pro-latest")
+if os.environ.get("GEMINI_FAKE_MODEL") == "1":
+    # Canned, streamed answers for local testing; see fake_model.py
+    from fake_model import FakeModel
+    model = FakeModel()
+    logging.info("Using the fake generative model.")
+else:
+    model = genai.GenerativeModel("gemini-1.5-pro-latest")
 
-api_key = os.environ.get("GEMINI_API_KEY")
-if not api_key:
-    logging.error("GEMINI_API_KEY not found in environment variables.")
-    raise ValueError("GEMINI_API_KEY not found in environment variables.")
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        logging.error("GEMINI_API_KEY not found in environment variables.")
+        raise ValueError("GEMINI_API_KEY not found in environment variables.")
 
-genai.configure(api_key=api_key)
-logging.info("Generative AI model configured successfully.")
+    genai.configure(api_key=api_key)
+    logging.info("Generative AI model configured successfully.")
 
 # Add a global toggle for history-based answers
 history_access_enabled = False  # Default is OFF
-logging.debug(f"History access enabled? {history_access_enabled}")
+logging.debug("History access enabled? %s", history_access_enabled)
 
 # --- Sentiment & Tone Detection ---
+sentiment_keywords = {
+    "sad": ["sad", "depressed", "tired", "stressed", "lonely"],
+    "happy": ["happy", "excited", "great", "fun", "love", "loving"],
+    "angry": ["angry", "frustrated", "annoyed", "upset"],
+}
+
 def detect_sentiment(text: str) -> str:
-    logging.debug(f"Detecting sentiment for text: {text}")
-    lowered = text.lower()
-    if any(word in lowered for word in ["sad", "depressed", "tired", "stressed", "lonely"]):
-        return "sad"
-    elif any(word in lowered for word in ["happy", "excited", "great", "fun", "love"]):
-        return "happy"
-    elif any(word in lowered for word in ["angry", "frustrated", "annoyed", "upset"]):
-        return "angry"
+    matched = query_matcher.match(text)
+    for sentiment in ("sad", "happy", "angry"):
+        if matched.has(sentiment):
+            return sentiment
     return "neutral"
 
 def get_tone(sentiment: str) -> str:
-    logging.debug(f"Getting tone for sentiment: {sentiment}")
+    logging.debug("Getting tone for sentiment: %s", sentiment)
     return {
         "sad": "empathetic and kind",
         "happy": "excited and cheerful",
@@ -61,74 +108,6 @@ def get_tone(sentiment: str) -> str:
         "neutral": "friendly and informative"
     }.get(sentiment, "friendly")
 
-# --- Greeting & Side Notes ---
-greeting = [
-    "Hey there! 😊",
-    "Hi! What’s on your mind today?",
-    "Hello! Ready to explore something new?",
-    "Yo! Got a question for me?",
-    "Hey! Curious about something?",
-    "Hi there! What can I help you with?",
-    "Welcome! What’s up?",
-]
-
-side_note = [
-    "By the way, you asked a great question!",
-    "Fun fact: this comes up a lot in interesting discussions!",
-    "You're diving into a pretty cool topic.",
-    "People don’t ask this enough — well done.",
-    "This is one of those questions I love getting!",
-    "I genuinely appreciate your quriosity!"
-]
-
-follow_up = {
-    "explore": [
-        "Would you like to explore this further?",
-        "Want me to break it down more?",
-        "Should I expand on that?",
-        "Would a detailed explanation help here?",
-        "Curious about the 'why' behind this?",
-        "Would a deeper dive into this topic help?",
-        "Shall I walk you through this step-by-step?",
-    ],
-    "examples": [
-        "Need an example to make it clearer?",
-        "Shall I walk you through a sample scenario?",
-        "Would a real-world analogy help here?",
-        "Would you like a visual or analogy to understand it better?",
-        "Want to hear how this works in real life?",
-        "Should I explain this like you're five?",
-    ],
-    "connections": [
-        "Want to know how this connects to something bigger?",
-        "Would you like the advanced version of this?",
-        "Want me to show how this works with real data?",
-        "Want a nerdy detail? I’ve got one.",
-        "Feeling curious? I can go on!",
-        "Want to geek out on this a bit more?"
-    ],
-    "decisions": [
-        "Would it help if I listed pros and cons?",
-        "Need help choosing between similar options?",
-        "Want help choosing between options?",
-        "Should I compare a few approaches?",
-        "Shall I summarize the key takeaways?",
-    ],
-    "style_variation": [
-        "Want to hear the quick version and then the in-depth one?",
-        "Would you prefer a comparison to something familiar?",
-        "Want me to explain it like a story?",
-        "Would you like a more casual or formal explanation?",
-    ],
-    "friendly": [
-        "Want to keep chatting about this?",
-        "Would you like a fun fact connected to this?",
-        "Having fun? Want more of this?",
-        "This is exciting right? Want to know more?",
-        "Are you loving the conversation so far?"
-    ]
-}
-
 # Expanded trigger keywords
 trigger_keywords = [
     "explain", "how", "why", "step", "details", "example", "in-depth", "deep", "more info", "what is",
@@ -145,26 +124,47 @@ FOLLOW_UP_RESPONSES = [
             "more info", "keep going", "i’m interested", "yes, please", "want to learn",
             "do explain", "want to know more", "tell me more", "please do", "what else"
         ]
+intent_keywords = {
+    "compare": ["compare", "comparison", "vs", "vs.", "versus", "difference between", "pros and cons"],
+    "examples": ["example", "examples", "analogy", "illustrate"],
+    "connections": ["connect", "connected", "connection", "connections", "relation", "related", "linked", "association"],
+}
+
+# Every keyword list above, compiled once into a single matcher; see keyword_matcher.py
+query_matcher = KeywordMatcher({
+    "history": history_keywords,
+    "analytics": analytics_keywords,
+    "analytics_measure": analytics_measure_keywords,
+    "history_anchor": history_anchor_keywords,
+    "sessions": sessions_keywords,
+    "deep": trigger_keywords,
+    "follow_up": FOLLOW_UP_RESPONSES,
+    **sentiment_keywords,
+    **intent_keywords,
+})
+
 def needs_deep_answer(user_input: str) -> bool:
-    return any(word in user_input.lower() for word in trigger_keywords)
+    return query_matcher.match(user_input).has("deep")
 
 def detect_intent(user_input: str) -> str:
-    lowered = user_input.lower()
-    if any(kw in lowered for kw in ["compare", "vs", "difference between", "pros and cons"]):
-        return "compare"
-    elif any(kw in lowered for kw in ["example", "analogy", "illustrate"]):
-        return "examples"
-    elif any(kw in lowered for kw in ["connect", "relation", "linked", "association"]):
-        return "connections"
-    elif any(kw in lowered for kw in trigger_keywords):
+    matched = query_matcher.match(user_input)
+    for intent in ("compare", "examples", "connections"):
+        if matched.has(intent):
+            return intent
+    if matched.has("deep"):
         return "explore"
-    else:
-        return "friendly"
+    return "friendly"
+
+# Shared keep-alive client for DuckDuckGo; see http_client.py
+duckduckgo = get_backend("duckduckgo", DUCKDUCKGO_URL)
 
+@timed("ddg")
 def search_duckduckgo(query: str) -> str:
     try:
-        url = f"https://api.duckduckgo.com/?q={query}&format=json&no_html=1&skip_disambig=1"
-        response = requests.get(url, timeout=5)
+        response = duckduckgo.get(
+            params={"q": query, "format": "json", "no_html": 1, "skip_disambig": 1},
+            deadline=time.monotonic() + DDG_TIMEOUT,
+        )
         data = response.json()
 
         if data.get("AbstractText"):
@@ -175,127 +175,198 @@ def search_duckduckgo(query: str) -> str:
                     return topic["Text"]
         return "I couldn't find a good answer on that. Want me to dig deeper?"
     except Exception as e:
+        stage_errors.inc(stage="ddg")
+        logging.warning("DuckDuckGo lookup failed: %s", e)
         return f"Error accessing DuckDuckGo: {str(e)}"
 
 
+def is_negative_answer(response: str) -> bool:
+    lowered = response.lower()
+    return lowered.startswith("i couldn't find a good answer") or lowered.startswith("sorry, i couldn't find")
+
+def cached_duckduckgo(query: str) -> str:
+    """
+    search_duckduckgo behind the response cache. Errors are never cached.
+    """
+    key = make_cache_key("ddg", query)
+    response = response_cache.get(key)
+    if response is None:
+        response = search_duckduckgo(query)
+        if not response.startswith("Error accessing DuckDuckGo"):
+            response_cache.set(key, response, negative=is_negative_answer(response))
+    return response
+
+
 # --- Browser History Query Detection ---
-def is_browser_history_query(query: str) -> bool:
-    logging.debug(f"Checking if query is related to browser history: {query}")
-    if not session.get('history_access_enabled', False):
+def history_intent(matched):
+    """
+    Which history answer a matched query asks for: "analytics", "sessions",
+    "history", or None when it isn't about the user's browsing.
+    """
+    if matched.has("analytics") or (matched.has("analytics_measure") and matched.has("history_anchor")):
+        return "analytics"
+    if matched.has("sessions"):
+        return "sessions"
+    if matched.has("history"):
+        return "history"
+    return None
+
+def is_browser_history_query(query: str, history_access: bool = False) -> bool:
+    if not history_access:
         logging.debug("History access is disabled.")
         return False
     
-    is_query_history_related = any(keyword in query.lower() for keyword in history_keywords)
-    logging.debug(f"Is query history-related? {is_query_history_related}")
+    with span("keyword_match"):
+        matched = query_matcher.match(query)
+    is_query_history_related = history_intent(matched) is not None
+    logging.debug("Is query history-related? %s", is_query_history_related)
     return is_query_history_related
 
 
-# Function to fetch Chrome browser history
-def fetch_brave_history(keyword=None, date=None):
-    logging.debug(f"Fetching Brave browser history with keyword: {keyword}, date: {date}")
-    history_db = os.path.expanduser("~/.config/BraveSoftware/Brave-Browser/Default/History")
-    temp_db = tempfile.NamedTemporaryFile(delete=False).name
+# --- Browser History ---
+# Keyword searches return the best-ranked matches rather than every row
+HISTORY_SEARCH_LIMIT = 20
+
+# Chat answers show only the most recent rows; the full list is paged via /history
+HISTORY_RESULT_LIMIT = 50
+HISTORY_PAGE_SIZE = 50
+
+def history_time_range(date):
+    """
+    Turns a DateRange or a date expression ("last week", "March 3") into a
+    [start, end) pair of WebKit timestamps, or (None, None) for no time filter.
+    """
+    if not date:
+        return None, None
+    date_range = date if isinstance(date, DateRange) else resolve_date_range(date)
+    if date_range is None:
+        logging.debug("Could not resolve date expression: %r", date)
+        return None, None
+    return to_webkit_range(date_range)
+
+def format_history_entry(entry) -> str:
+    timestamp = webkit_to_datetime(entry.last_visit_time)
+    return f"{entry.title} ({entry.url}) - Last visited: {timestamp} [{entry.source.label}]"
+
+def history_entry_to_dict(entry) -> dict:
+    return {
+        "url": entry.url,
+        "title": entry.title,
+        "last_visited": webkit_to_datetime(entry.last_visit_time).isoformat(sep=" "),
+        "browser": entry.source.label,
+    }
 
+def fetch_browser_history(keyword=None, date=None, browsers=None):
+    """
+    Fetches history from every browser profile on the machine (or only `browsers`).
+    `keyword` may be a single string or the list of keywords from detect_intent_and_entities.
+    """
     try:
-        shutil.copy2(history_db, temp_db)
-        logging.debug(f"Copied Brave history database to temporary file: {temp_db}")
-        conn = sqlite3.connect(temp_db)
-        cursor = conn.cursor()
-
-        query = "SELECT url, title, last_visit_time FROM urls"
-        conditions = []
-        params = []
-
-        if keyword:
-            conditions.append("(title LIKE ? OR url LIKE ?)")
-            params.extend([f"%{keyword}%", f"%{keyword}%"])
-
-        if date:
-            # Parse the date into a timestamp
-            try:
-                start_time = datetime.strptime(date, "%Y-%m-%d")
-            except ValueError:
-                start_time = datetime.now() - timedelta(days=1)  # Default to yesterday if parsing fails
-            start_timestamp = int((start_time - datetime(1601, 1, 1)).total_seconds() * 1e6)
-            conditions.append("last_visit_time >= ?")
-            params.append(start_timestamp)
-
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        query += " ORDER BY last_visit_time DESC"
-        logging.debug(f"Executing query: {query} with params: {params}")
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
-
-        history = []
-        for url, title, last_visit_time in results:
-            timestamp = datetime(1601, 1, 1) + timedelta(microseconds=last_visit_time)
-            history.append(f"{title} ({url}) - Last visited: {timestamp}")
-
-        logging.debug(f"Fetched {len(history)} history entries.")
+        start_time, end_time = history_time_range(date)
+        with span("history_query"):
+            entries = history_engine.search(
+                keywords=keyword,
+                start_time=start_time,
+                end_time=end_time,
+                limit=HISTORY_SEARCH_LIMIT if keyword else HISTORY_RESULT_LIMIT,
+                browsers=browsers,
+            )
+
+        with span("format"):
+            history = [format_history_entry(entry) for entry in entries]
+
+        logging.debug("Fetched %d history entries.", len(history))
         return "\n".join(history) if history else "No matching history found."
     except Exception as e:
-        logging.error(f"Error fetching browser history: {e}")
+        logging.error("Error fetching browser history: %s", e)
         return f"Error fetching browser history: {e}"
-    finally:
-        if os.path.exists(temp_db):
-            os.remove(temp_db)
-        logging.info("Temporary history data cleared securely.")
 
-# filepath: d:\ChatBot-Histroy-Annalyzer\search.py
-def fetch_edge_history():
+def ranked_history(keyword, date=None, browsers=None) -> str:
     """
-    Fetches the browsing history from Microsoft Edge's history database.
+    Answers a keyword history question with full-text (BM25) matches and pages
+    that merely resemble the keywords ("rust async article" -> "Asynchronous
+    Programming in Rust"), fused into one ranking.
     """
-    # Get the path to Edge's history database from environment variables
-    history_db = os.environ.get("EDGE_HISTORY_PATH")
-    if not history_db:
-        logging.error("EDGE_HISTORY_PATH is not set in environment variables.")
-        return "Error: Edge history path is not configured."
-
-    temp_db = tempfile.NamedTemporaryFile(delete=False).name  # Temporary copy of the database
-
     try:
-        # Make a copy of the database to avoid locking issues
-        shutil.copy2(history_db, temp_db)
-
-        # Connect to the copied database
-        conn = sqlite3.connect(temp_db)
-        cursor = conn.cursor()
-
-        # Query to fetch the last 10 visited URLs
-        cursor.execute("""
-            SELECT url, title, last_visit_time
-            FROM urls
-            ORDER BY last_visit_time DESC
-            LIMIT 10
-        """)
-
-        results = cursor.fetchall()
-        conn.close()
-
-        # Format the results
-        history = []
-        for url, title, last_visit_time in results:
-            # Convert Edge's timestamp to a readable format
-            timestamp = datetime(1601, 1, 1) + timedelta(microseconds=last_visit_time)
-            history.append(f"{title} ({url}) - Last visited: {timestamp}")
-
-        return "\n".join(history)
+        start_time, end_time = history_time_range(date)
+        with span("history_query"):
+            entries = history_engine.ranked_search(
+                keyword, start_time=start_time, end_time=end_time, limit=HISTORY_SEARCH_LIMIT, browsers=browsers
+            )
     except Exception as e:
-        logging.error(f"Error fetching browser history: {e}")
+        logging.error("Error fetching browser history: %s", e)
         return f"Error fetching browser history: {e}"
-    finally:
-        # Clean up the temporary database copy
-        if os.path.exists(temp_db):
-            os.remove(temp_db)
-        logging.info("Temporary history data cleared securely.")
+    with span("format"):
+        return "\n".join(format_history_entry(entry) for entry in entries) if entries else "No matching history found."
+
+def fetch_brave_history(keyword=None, date=None):
+    return fetch_browser_history(keyword=keyword, date=date, browsers=["Brave"])
+
+def fetch_edge_history(keyword=None, date=None):
+    """
+    Fetches the browsing history from Microsoft Edge's history database.
+    """
+    return fetch_browser_history(keyword=keyword, date=date, browsers=["Edge"])
+
+def fetch_history_page(keyword=None, date=None, cursor=None, limit=HISTORY_PAGE_SIZE) -> dict:
+    """
+    Returns one page of history across all browsers, newest first, plus the cursor for the next page.
+    """
+    start_time, end_time = history_time_range(date)
+    with span("history_query"):
+        entries, next_cursor = history_engine.page(
+            keywords=keyword, start_time=start_time, end_time=end_time, cursor=cursor, limit=limit
+        )
+    with span("format"):
+        items = [history_entry_to_dict(entry) for entry in entries]
+    return {"items": items, "next_cursor": next_cursor}
+
+def iter_history(keyword=None, date=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Yields history entries across all browsers one at a time, newest first.
+    """
+    start_time, end_time = history_time_range(date)
+    for entry in history_engine.iter_entries(
+        keywords=keyword, start_time=start_time, end_time=end_time, page_size=page_size
+    ):
+        yield history_entry_to_dict(entry)
+
+def answer_history_query(user_input: str, intent=None, entities=None) -> str:
+    """
+    Answers a history question: analytics questions get aggregates, questions about what the
+    user was doing get browsing sessions, the rest get matching pages.
+    """
+    if intent is None:
+        intent, entities = detect_intent_and_entities(user_input)
+
+    # Fetch browser history based on entities (e.g., date)
+    date = entities.get("date_range")
+    if intent == "analytics":
+        start_time, end_time = history_time_range(date)
+        try:
+            with span("history_analytics"):
+                return analyze_history(user_input, start_time, end_time)
+        except Exception as e:
+            logging.error("Error analyzing browser history: %s", e)
+            return f"Error analyzing browser history: {e}"
+    if intent == "sessions":
+        start_time, end_time = history_time_range(date)
+        try:
+            with span("history_sessions"):
+                return answer_sessions(start_time, end_time)
+        except Exception as e:
+            logging.error("Error reconstructing browsing sessions: %s", e)
+            return f"Error reconstructing browsing sessions: {e}"
+
+    keywords = entities.get("keywords")
+    if keywords:
+        history_response = ranked_history(keywords, date)
+    else:
+        history_response = fetch_browser_history(date=date)
+    return f"Browser History:\n{history_response}"
 
 # --- Handle Privacy Checkpoint ---
 def handle_privacy_checkpoint(user_input: str) -> str:
-    logging.debug(f"Handling privacy checkpoint for input: {user_input}")
     if not session.get('history_access_enabled', False):
         if "enable just for this session" in user_input.lower():
             session['history_access_enabled'] = True
@@ -319,29 +390,21 @@ def handle_privacy_checkpoint(user_input: str) -> str:
             )
     return None
 
-chat_memory = []
-
-MAX_MEMORY = 20
-
 # --- Main Search Function ---
-def search_with_gemini(user_input: str, chat_memory: list) -> str:
-    logging.debug(f"Processing user input: {user_input}")
-    
+def search_with_gemini(user_input: str, conversation_id: str, history_access: bool = False) -> str:
+    logging.debug("Processing a %d character query", len(user_input))
+
     # Detect intent and entities
     intent, entities = detect_intent_and_entities(user_input)
-    logging.debug(f"Detected intent: {intent}, entities: {entities}")
+    logging.debug("Detected intent: %s, entity types: %s", intent, list(entities))
 
-    if intent == "history":
+    if intent in ("history", "analytics", "sessions"):
         # Handle history-related queries
-        if not session.get('history_access_enabled', False):
+        if not history_access:
             return (
                 "History access is disabled. Please enable it to ask history-related questions."
             )
-
-        # Fetch browser history based on entities (e.g., date)
-        date = entities.get("date")
-        history_response = fetch_brave_history(date=date)
-        return f"Browser History:\n{history_response}"
+        return answer_history_query(user_input, intent, entities)
 
     # Handle general queries
     if not user_input.strip():
@@ -349,108 +412,268 @@ def search_with_gemini(user_input: str, chat_memory: list) -> str:
         return "Please enter a valid question."
 
     try:
-        # Safety settings for the generative model
-        safety_settings = {
-            "HARASSMENT": "BLOCK_NONE",
-            "HATE_SPEECH": "BLOCK_NONE",
-            "SEXUAL": "BLOCK_NONE",
-            "DANGEROUS": "BLOCK_NONE"
-        }
-
-        # Try DuckDuckGo for quick answers
-        logging.debug("Querying DuckDuckGo for a quick answer.")
-        ddg_response = search_duckduckgo(user_input)
-
-        if ddg_response and not ddg_response.lower().startswith("i couldn't find a good answer"):
-            chat_memory.append({
-                "user_input": user_input,
-                "bot_response": ddg_response
-            })
-            if len(chat_memory) > MAX_MEMORY:
-                chat_memory.pop(0)
-            logging.debug("Returning DuckDuckGo response.")
-            return ddg_response
-
-        # Handle deep answers using the generative model
+        summary, history = conversation_store.context(conversation_id)
+        result = answer_general(user_input, history, summary)
+
+        # Update the conversation
+        remember(conversation_id, history, summary, user_input, result)
+        return result
+
+    except Exception as e:
+        logging.error("Error in search_with_gemini: %s", e)
+        return f"Error: {str(e)}"
+
+
+def answer_general(user_input: str, history=(), summary: str = "", batch: bool = False) -> str:
+    """
+    Answers a general question from the cache, DuckDuckGo or Gemini, given the
+    conversation so far. Leaves the conversation itself untouched. `batch` runs
+    the lookups on the batch answer pool.
+    """
+    cached, cache_key, prompt = plan_answer(user_input, list(history), summary)
+    if cached is not None:
+        answers_total.inc(source="cache")
+        return cached
+
+    def generate(cancelled):
         logging.debug("Generating a deep answer using the generative model.")
-        is_follow_up = needs_deep_answer(user_input)
-        intent = detect_intent(user_input)
-        sentiment = detect_sentiment(user_input)
-        tone = get_tone(sentiment)
+        result = generate_answer(prompt, cancelled)
+        if result is not None and cache_key:
+            response_cache.set(cache_key, result, negative=is_negative_answer(result))
+        return result
 
-        # Context logic for generative model
-        context = "\n".join(
-            f"User: {msg['user_input']}\nAssistant: {msg['bot_response']}"
-            for msg in chat_memory[-MAX_MEMORY:]
-        )
+    # DuckDuckGo and Gemini run concurrently; a real DuckDuckGo answer wins as soon as it arrives
+    source, result = first_good_answer(
+        quick=lambda: cached_duckduckgo(user_input),
+        slow=generate,
+        is_good=is_good_quick_answer,
+        batch=batch,
+    )
+    answers_total.inc(source="duckduckgo" if source == "quick" else "gemini")
+    logging.debug("Returning a %d character %s answer", len(result), "DuckDuckGo" if source == "quick" else "generative")
+    return result
 
-        # Prompt for the generative model
-        prompt = f"""
-You are a friendly and knowledgeable assistant who acts like a smart, human-powered search engine. Think of yourself as a helpful guide — someone who explains concepts clearly, provides useful information quickly, and makes learning feel effortless.
 
-Your job is to:
-- Provide trustworthy, accurate, and digestible information (like an informative book).
-- Sound approachable, curious, and slightly warm (not robotic).
-- Use Markdown formatting (*bold, *italics, bullet points, etc.) to improve clarity.
-- Anticipate what the user might want next, and gently offer follow-up help or suggestions.
+# Upper bound on queries in one search_batch call
+BATCH_MAX_QUERIES = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", "100"))
 
-*Conversation Context*:
-{context}
+def search_batch(queries, history_access: bool = False) -> list:
+    """
+    Answers many independent questions at once. Intent and entities for all of
+    them come from one nlp.pipe batch, identical queries are answered once, and
+    the answers are worked out concurrently on the bounded batch pool. Returns
+    one dict per query, in order: {"query", "intent", "response"} or {"query", "error"}.
+    """
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch.")
+
+    keys = [normalize_query(query) for query in queries]
+    # Queries differing only in case or spacing are answered once, as first written
+    first_written = {}
+    for query, key in zip(queries, keys):
+        if key:
+            first_written.setdefault(key, query.strip())
+    unique = list(first_written)
+    with span("nlp"):
+        analyses = analyze_batch([first_written[key] for key in unique])
+
+    def answer(item):
+        key, analysis = item
+        query = first_written[key]
+        intent, entities = intent_and_entities_from_analysis(query, analysis)
+        if intent in ("history", "analytics", "sessions"):
+            if not history_access:
+                raise PermissionError("History access is disabled.")
+            return intent, answer_history_query(query, intent, entities)
+        return intent, answer_general(query, batch=True)
+
+    answers = dict(zip(unique, map_concurrently(answer, zip(unique, analyses))))
+    results = []
+    for query, key in zip(queries, keys):
+        if not key:
+            results.append({"query": query, "error": "Please enter a valid question."})
+            continue
+        outcome, error = answers[key]
+        if error is not None:
+            results.append({"query": query, "error": str(error)})
+        else:
+            intent, response = outcome
+            results.append({"query": query, "intent": intent, "response": response})
+    return results
 
-*Current User Question*:
-{user_input}
 
-*Tone to use*: {tone}
+def stream_with_gemini(user_input: str, conversation_id: str, history_access: bool = False):
+    """
+    Same answers as search_with_gemini, yielded as text chunks while Gemini
+    generates them. History, cached and DuckDuckGo answers come as one chunk.
+    """
+    logging.debug("Streaming an answer to a %d character query", len(user_input))
 
----
+    intent, entities = detect_intent_and_entities(user_input)
+    if intent in ("history", "analytics", "sessions"):
+        if not history_access:
+            yield "History access is disabled. Please enable it to ask history-related questions."
+            return
+        yield answer_history_query(user_input, intent, entities)
+        return
 
-Now generate a response using the following style:
+    if not user_input.strip():
+        yield "Please enter a valid question."
+        return
 
-{f'''
-Start with a friendly greeting like: "{greeting}" (or something equally warm and welcoming).
+    try:
+        summary, history = conversation_store.context(conversation_id)
+        cached, cache_key, prompt = plan_answer(user_input, history, summary)
+        if cached is not None:
+            answers_total.inc(source="cache")
+            remember(conversation_id, history, summary, user_input, cached)
+            yield cached
+            return
+
+        def generate(cancelled):
+            logging.debug("Streaming a deep answer from the generative model.")
+            for chunk in generate_answer_stream(prompt):
+                if cancelled.is_set():
+                    break
+                yield chunk
+
+        source, parts = None, []
+        for source, chunk in first_good_stream(
+            quick=lambda: cached_duckduckgo(user_input),
+            slow=generate,
+            is_good=is_good_quick_answer,
+        ):
+            parts.append(chunk)
+            yield chunk
+
+        result = "".join(parts).strip()
+        if not result:
+            result = "Sorry, I couldn't find a good answer."
+            yield result
+        # Only complete streams reach this point, so partial answers are never cached
+        answers_total.inc(source="duckduckgo" if source == "quick" else "gemini")
+        if source == "slow" and cache_key:
+            response_cache.set(cache_key, result, negative=is_negative_answer(result))
+        remember(conversation_id, history, summary, user_input, result)
 
-Give a brief, clear summary of the topic (2–3 sentences). Keep it informative, but easy to digest.
+    except Exception as e:
+        logging.error("Error in stream_with_gemini: %s", e)
+        yield f"Error: {str(e)}"
 
-Wrap up with a follow-up suggestion like: "{follow_up}" if it fits naturally into the flow.
 
-Add a light side comment if appropriate: "{side_note}".
-''' if not is_follow_up else '''
-This is a follow-up question.
+def is_good_quick_answer(answer: str) -> bool:
+    return bool(answer) and not is_negative_answer(answer) and not answer.startswith("Error accessing DuckDuckGo")
 
-Now provide a more in-depth, structured explanation:
-- Use examples, analogies, or comparisons.
-- Build on prior information without repeating it.
-- Keep the tone friendly, expert, and easy to understand.
-'''}
-"""
 
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 1,
-                "top_k": 1,
-                "max_output_tokens": 400,
-            },
-            safety_settings=safety_settings
-        )
+def plan_answer(user_input: str, history: list, summary: str = ""):
+    """
+    Returns (cached_answer, cache_key, prompt). When a cached answer exists the
+    other two are None; cache_key is None once there is conversation context.
+    """
+    # Work out tone and style up front so Gemini can start alongside DuckDuckGo
+    with span("keyword_match"):
+        is_follow_up = needs_deep_answer(user_input)
+        intent = detect_intent(user_input)
+        sentiment = detect_sentiment(user_input)
+        tone = get_tone(sentiment)
 
-        result = response.text.strip() if response and response.text else "Sorry, I couldn't find a good answer."
-        logging.debug(f"Generated response: {result}")
+    # Answers already in the cache need no outbound call at all
+    ddg_response = response_cache.get(make_cache_key("ddg", user_input))
+    if ddg_response and not is_negative_answer(ddg_response):
+        logging.debug("Returning cached DuckDuckGo response.")
+        return ddg_response, None, None
+
+    # The prompt carries the conversation, so an answer given with context is neither
+    # served from nor stored in the cache shared with other conversations
+    cache_key = None
+    if not history and not summary:
+        cache_key = make_cache_key("gemini", user_input, tone, f"{intent}:{is_follow_up}")
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logging.debug("Returning cached generative answer.")
+            return cached, None, None
+
+    with span("prompt"):
+        prompt = build_prompt(user_input, history, summary, tone, intent, is_follow_up)
+    return None, cache_key, prompt
+
+
+def remember(conversation_id: str, history: list, summary: str, user_input: str, bot_response: str):
+    # The turn leaving the verbatim window is folded into the rolling summary as it goes
+    conversation_store.append(
+        conversation_id, user_input, bot_response, summary=fold_summary(summary, history)
+    )
+
+
+# Safety settings for the generative model
+SAFETY_SETTINGS = {
+    "HARASSMENT": "BLOCK_NONE",
+    "HATE_SPEECH": "BLOCK_NONE",
+    "SEXUAL": "BLOCK_NONE",
+    "DANGEROUS": "BLOCK_NONE"
+}
 
-        # Update chat memory
-        chat_memory.append({
-            "user_input": user_input,
-            "bot_response": result
-        })
-        if len(chat_memory) > MAX_MEMORY:
-            chat_memory.pop(0)
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 400,
+}
 
-        return result
 
-    except Exception as e:
-        logging.error(f"Error in search_with_gemini: {e}")
-        return f"Error: {str(e)}"
+@timed("gemini")
+def generate_answer(prompt: str, cancelled=None):
+    """
+    The model's full answer to `prompt`. With a `cancelled` Event the answer is
+    streamed and assembled here, so once DuckDuckGo wins the call stops at the
+    next chunk and frees its answer worker; it then returns None.
+    """
+    if cancelled is None:
+        response = model.generate_content(
+            prompt,
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS,
+            request_options={"timeout": GEMINI_TIMEOUT},
+        )
+        return response.text.strip() if response and response.text else "Sorry, I couldn't find a good answer."
+
+    response = model.generate_content(
+        prompt,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS,
+        request_options={"timeout": GEMINI_TIMEOUT},
+        stream=True,
+    )
+    parts = []
+    for chunk in response:
+        if cancelled.is_set():
+            logging.debug("Dropping a generative answer nobody is waiting for")
+            return None
+        if chunk.text:
+            parts.append(chunk.text)
+    return "".join(parts).strip() or "Sorry, I couldn't find a good answer."
+
+
+def generate_answer_stream(prompt: str):
+    """
+    Yields the model's answer chunk by chunk as it is generated.
+    """
+    with span("gemini"):
+        started = time.perf_counter()
+        response = model.generate_content(
+            prompt,
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS,
+            request_options={"timeout": GEMINI_TIMEOUT},
+            stream=True,
+        )
+        first = True
+        for chunk in response:
+            if first:
+                stage_seconds.observe(time.perf_counter() - started, stage="gemini_first_chunk")
+                first = False
+            if chunk.text:
+                yield chunk.text
 
 
 
@@ -458,22 +681,40 @@ def detect_intent_and_entities(query: str):
     """
     Detects the intent and extracts entities from the user query.
     """
-    doc = nlp(query.lower())
+    with span("nlp"):
+        analysis = analyze(query)
+    return intent_and_entities_from_analysis(query, analysis)
+
+
+def intent_and_entities_from_analysis(query: str, analysis):
+    """
+    Builds the intent and entities from an already computed nlp_pipeline analysis.
+    """
     intent = "general"
     entities = {}
 
     # Check for history-related intent
-    if any(keyword in query.lower() for keyword in history_keywords):
-        intent = "history"
+    intent = history_intent(query_matcher.match(query)) or intent
 
     # Extract date-related entities
-    for ent in doc.ents:
-        if ent.label_ in ["DATE", "TIME"]:
+    date_tokens = set()
+    for ent in analysis.entities:
+        if ent.label in ["DATE", "TIME"]:
             entities["date"] = ent.text
-
-    # Extract keywords for filtering history
-    keywords = [token.text for token in doc if token.is_alpha and token.text not in history_keywords]
+            date_tokens.update(range(ent.start, ent.end))
+
+    # Resolve the date expression (or, failing that, the whole query) to a bounded range
+    date_range = resolve_date_range(entities.get("date")) or resolve_date_range(query)
+    if date_range:
+        entities["date_range"] = date_range
+
+    # Extract keywords for filtering history; drop stop words, dates and history phrasing
+    keywords = [
+        token.lower for token in analysis.tokens
+        if token.is_alpha and not token.is_stop and token.i not in date_tokens
+        and token.lower not in history_filler_words and token.lower not in DATE_WORDS
+    ]
     if keywords:
         entities["keywords"] = keywords
 
-    return intent, entities
\ No newline at end of file
+    return intent, entities
@@ -0,0 +1,269 @@
+import re
+import math
+import zlib
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# Field weights: what a page is called matters more than where it lives
+TITLE_WEIGHT = 1.0
+URL_WEIGHT = 0.6
+DOMAIN_WEIGHT = 0.4
+
+# Words longer than this also contribute their prefix, so "asynchronous" meets "async"
+PREFIX_LENGTH = 4
+
+# The delta segment is merged into the base once it holds this share of the postings
+MERGE_RATIO = 0.1
+
+# Query features present in more than this share of pages carry no signal and are skipped
+MAX_DOCUMENT_FREQUENCY = 0.3
+
+# Pages read from the store per refresh batch
+REFRESH_BATCH_SIZE = 20000
+
+STOP_WORDS = frozenset(
+    "a an the and or of to in on for with from by at as is are was be it this that "
+    "how what why when who which my i you your about into vs".split()
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+SemanticHit = namedtuple("SemanticHit", ["score", "url_id", "last_visit_time"])
+
+
+def _words(text: str):
+    return [word for word in _WORD.findall((text or "").lower()) if word not in STOP_WORDS]
+
+
+@lru_cache(maxsize=1 << 17)
+def _hash(feature: str) -> int:
+    # Stable across processes, unlike hash(); cached since vocabularies repeat heavily
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+def text_features(title: str = "", url_tokens: str = "", domain: str = "") -> dict:
+    """
+    Hashed feature -> weight for one page (or query): words, word prefixes and
+    title bigrams, weighted by field and log-scaled by repetition.
+    """
+    counts = {}
+    title_words = _words(title)
+    for words, weight in ((title_words, TITLE_WEIGHT), (_words(url_tokens), URL_WEIGHT),
+                          (_words(domain.replace(".", " ")), DOMAIN_WEIGHT)):
+        for word in words:
+            key = "w:" + word
+            counts[key] = counts.get(key, 0.0) + weight
+            if len(word) > PREFIX_LENGTH:
+                key = "p:" + word[:PREFIX_LENGTH]
+                counts[key] = counts.get(key, 0.0) + weight * 0.5
+    for first, second in zip(title_words, title_words[1:]):
+        key = f"b:{first} {second}"
+        counts[key] = counts.get(key, 0.0) + TITLE_WEIGHT * 0.5
+
+    features = {}
+    for feature, count in counts.items():
+        key = _hash(feature)
+        features[key] = features.get(key, 0.0) + (1.0 + math.log(count) if count > 1 else count)
+    return features
+
+
+class _Segment:
+    """
+    Postings sorted by feature: (features, rows, weights). A feature's postings
+    are the slice found by binary search, i.e. one column of the page x feature matrix.
+    """
+
+    __slots__ = ("features", "rows", "weights")
+
+    def __init__(self, features, rows, weights):
+        order = np.argsort(features, kind="stable")
+        self.features = features[order]
+        self.rows = rows[order]
+        self.weights = weights[order]
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.uint32), np.empty(0, np.int32), np.empty(0, np.float32))
+
+    def __len__(self):
+        return len(self.features)
+
+    def bounds(self, query_features: np.ndarray):
+        return (np.searchsorted(self.features, query_features, side="left"),
+                np.searchsorted(self.features, query_features, side="right"))
+
+
+class SemanticIndex:
+    """
+    Sparse TF-IDF index over one store's pages (title, URL words, domain).
+
+    Page vectors are L2-normalised hashed features kept as sorted postings in
+    NumPy arrays: a large base segment plus a small delta that new and changed
+    pages are appended to, merged when it grows. A query is one sparse
+    matrix-vector product (gather + bincount) and an argpartition top-k.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(generation=0)
+
+    def _reset(self, generation: int):
+        self.generation = generation
+        self.mark = (0, 0)  # (last_visit_time, id) high-water mark in the store
+        self._rows = {}  # url_id -> row
+        self._url_ids = np.empty(0, np.int64)
+        self._last_visit = np.empty(0, np.int64)
+        self._alive = np.empty(0, bool)
+        self._signatures = {}  # url_id -> hash of the indexed text
+        self._base = _Segment.empty()
+        self._delta = _Segment.empty()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def refresh(self, store) -> int:
+        """
+        Indexes pages that are new or revisited since the last refresh. Returns
+        the number of pages (re)indexed.
+        """
+        with self._lock:
+            generation = store.generation
+            if generation != self.generation:
+                self._reset(generation)
+
+            indexed = 0
+            while True:
+                rows = store.changed_urls(self.mark, limit=REFRESH_BATCH_SIZE)
+                if not rows:
+                    break
+                indexed += self._add(rows)
+                self.mark = (rows[-1][4], rows[-1][0])
+
+            if len(self._delta) > MERGE_RATIO * max(len(self._base), 1):
+                self._merge()
+            return indexed
+
+    def _add(self, rows) -> int:
+        features, posting_rows, weights = [], [], []
+        url_ids, last_visits = [], []
+        indexed = 0
+        for url_id, title, url_tokens, domain, last_visit_time in rows:
+            signature = zlib.crc32(f"{title}\x1f{url_tokens}\x1f{domain}".encode("utf-8"))
+            row = self._rows.get(url_id)
+            if row is not None and self._signatures.get(url_id) == signature:
+                # Revisited but unchanged: only the recency moves
+                self._last_visit[row] = last_visit_time
+                continue
+            if row is not None:
+                self._alive[row] = False
+
+            vector = text_features(title, url_tokens, domain)
+            if not vector:
+                continue
+            norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+            row = len(self._url_ids) + len(url_ids)
+            self._rows[url_id] = row
+            self._signatures[url_id] = signature
+            url_ids.append(url_id)
+            last_visits.append(last_visit_time)
+            features.extend(vector.keys())
+            posting_rows.extend([row] * len(vector))
+            weights.extend(weight / norm for weight in vector.values())
+            indexed += 1
+
+        if url_ids:
+            self._url_ids = np.concatenate([self._url_ids, np.array(url_ids, np.int64)])
+            self._last_visit = np.concatenate([self._last_visit, np.array(last_visits, np.int64)])
+            self._alive = np.concatenate([self._alive, np.ones(len(url_ids), bool)])
+            delta = _Segment(
+                np.array(features, np.uint32), np.array(posting_rows, np.int32), np.array(weights, np.float32)
+            )
+            self._delta = _Segment(
+                np.concatenate([self._delta.features, delta.features]),
+                np.concatenate([self._delta.rows, delta.rows]),
+                np.concatenate([self._delta.weights, delta.weights]),
+            )
+        return indexed
+
+    def _merge(self):
+        # Postings of replaced pages are dropped here, so the base only holds live rows
+        features = np.concatenate([self._base.features, self._delta.features])
+        rows = np.concatenate([self._base.rows, self._delta.rows])
+        weights = np.concatenate([self._base.weights, self._delta.weights])
+        keep = self._alive[rows]
+        self._base = _Segment(features[keep], rows[keep], weights[keep])
+        self._delta = _Segment.empty()
+
+    def search(self, text: str, k: int = 20, allowed_ids=None):
+        """
+        Returns up to k SemanticHit, best first, for pages similar to `text`.
+        `allowed_ids` optionally restricts results to those url ids.
+        """
+        query = text_features(text)
+        if not query:
+            return []
+
+        with self._lock:
+            n = len(self._url_ids)
+            if not n:
+                return []
+            query_features = np.fromiter(query.keys(), np.uint32, len(query))
+            query_weights = np.fromiter(query.values(), np.float32, len(query))
+
+            segments = [segment for segment in (self._base, self._delta) if len(segment)]
+            bounds = [segment.bounds(query_features) for segment in segments]
+            frequency = sum(hi - lo for lo, hi in bounds)
+
+            # idf-weighted query vector; features in too many pages are dropped
+            useful = (frequency > 0) & (frequency <= max(1, MAX_DOCUMENT_FREQUENCY * n))
+            if not useful.any():
+                return []
+            idf = np.log((n + 1) / (frequency + 1)) + 1.0
+            query_weights = query_weights * idf * useful
+
+            scores = np.zeros(n, np.float32)
+            for segment, (lo, hi) in zip(segments, bounds):
+                lengths = (hi - lo) * useful
+                if not lengths.any():
+                    continue
+                # Indices of every posting for the useful query features, without a Python loop
+                starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+                positions = starts + np.arange(lengths.sum())
+                contributions = segment.weights[positions] * np.repeat(query_weights, lengths)
+                scores += np.bincount(segment.rows[positions], weights=contributions, minlength=n).astype(np.float32)
+
+            scores[~self._alive] = 0
+            if allowed_ids is not None:
+                allowed = np.isin(self._url_ids, np.fromiter(allowed_ids, np.int64))
+                scores[~allowed] = 0
+
+            candidates = np.flatnonzero(scores)
+            if not len(candidates):
+                return []
+            k = min(k, len(candidates))
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            # Best score first; ties go to the more recent page
+            top = top[np.lexsort((-self._last_visit[top], -scores[top]))]
+            return [
+                SemanticHit(float(scores[row]), int(self._url_ids[row]), int(self._last_visit[row]))
+                for row in top
+            ]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_semantic_index(source) -> SemanticIndex:
+    """
+    Returns the shared index for a browser profile, creating it on first use.
+    """
+    with _indexes_lock:
+        index = _indexes.get(source.name)
+        if index is None:
+            index = _indexes[source.name] = SemanticIndex()
+        return index
+
@@ -1,5 +1,3 @@
-let typingInterval;
-
 // --- Utility Functions ---
 function parseMarkdownToHTML(text) {
   return text
@@ -15,46 +13,258 @@ function parseMarkdownToHTML(text) {
     .replace(/\n/g, "<br />");
 }
 
+// --- Virtualized Chat List ---
+// Every message and history row is an item in #chat-box, but only the items within
+// OVERSCAN_PX of the viewport are in the DOM. The rest are stand-ins of their measured
+// (or, until first shown, estimated) height, so thousands of rows stay cheap to scroll.
+const OVERSCAN_PX = 800;
+const ESTIMATED_ITEM_HEIGHT = 44;
+const STICK_THRESHOLD_PX = 40;
+
+class VirtualList {
+  constructor(viewport) {
+    this.viewport = viewport;
+    this.content = document.createElement("div");
+    this.content.className = "virtual-content";
+    viewport.appendChild(this.content);
+
+    this.items = [];  // { className, render, index, height, measured, top, wrapper, el, shown }
+    this.mounted = new Set();
+    this.stickToBottom = true;
+    this.frame = null;
+
+    viewport.addEventListener("scroll", () => {
+      const distance = viewport.scrollHeight - viewport.scrollTop - viewport.clientHeight;
+      this.stickToBottom = distance < STICK_THRESHOLD_PX;
+      this.schedule();
+    }, { passive: true });
+    window.addEventListener("resize", () => {
+      this.mounted.forEach(item => { item.measured = false; });
+      this.schedule();
+    });
+  }
+
+  // Adds an item; render(el) fills its element whenever it is (re)mounted
+  append(className, render) {
+    const item = {
+      className, render, index: this.items.length,
+      height: ESTIMATED_ITEM_HEIGHT, measured: false, top: 0, wrapper: null, el: null, shown: false
+    };
+    this.items.push(item);
+    this.schedule();
+    return item;
+  }
+
+  // The item's content changed in place; it is re-measured on the next frame
+  resized(item) {
+    item.measured = false;
+    this.schedule();
+  }
+
+  scrollToBottom() {
+    this.stickToBottom = true;
+    this.schedule();
+  }
+
+  // All DOM reads and writes happen here, at most once per frame
+  schedule() {
+    if (this.frame === null) {
+      this.frame = requestAnimationFrame(() => {
+        this.frame = null;
+        this.layout();
+      });
+    }
+  }
+
+  layout() {
+    // While reading older messages, keep the top visible item still as heights above it change
+    const anchor = this.stickToBottom ? null : this.anchor();
+    this.mounted.forEach(item => this.measure(item));
+    this.place(anchor);
+
+    // Mount what is now in view, measure it, and place again with the real heights
+    const fresh = this.mountVisible();
+    if (fresh.length) {
+      fresh.forEach(item => this.measure(item));
+      this.place(anchor);
+    }
+  }
+
+  anchor() {
+    const item = this.items[this.firstBelow(this.viewport.scrollTop)];
+    return item ? { item, offset: this.viewport.scrollTop - item.top } : null;
+  }
+
+  measure(item) {
+    if (!item.measured && item.wrapper) {
+      item.height = item.wrapper.offsetHeight;
+      item.measured = true;
+    }
+  }
+
+  place(anchor) {
+    let top = 0;
+    this.items.forEach(item => {
+      item.top = top;
+      top += item.height;
+    });
+    this.content.style.height = `${top}px`;
+    this.mounted.forEach(item => { item.wrapper.style.transform = `translateY(${item.top}px)`; });
+    if (this.stickToBottom) {
+      this.viewport.scrollTop = top;
+    } else if (anchor) {
+      this.viewport.scrollTop = anchor.item.top + anchor.offset;
+    }
+  }
+
+  // Index of the first item whose bottom is below `offset`
+  firstBelow(offset) {
+    let low = 0;
+    let high = this.items.length;
+    while (low < high) {
+      const middle = (low + high) >> 1;
+      const item = this.items[middle];
+      if (item.top + item.height <= offset) low = middle + 1;
+      else high = middle;
+    }
+    return low;
+  }
+
+  mountVisible() {
+    const viewTop = this.viewport.scrollTop - OVERSCAN_PX;
+    const viewBottom = this.viewport.scrollTop + this.viewport.clientHeight + OVERSCAN_PX;
+    const first = this.firstBelow(viewTop);
+    let last = first;
+    while (last < this.items.length && this.items[last].top < viewBottom) last++;
+
+    this.mounted.forEach(item => {
+      if (item.index < first || item.index >= last) this.unmount(item);
+    });
+
+    const fresh = [];
+    for (let i = first; i < last; i++) {
+      const item = this.items[i];
+      if (!item.wrapper) {
+        this.mount(item);
+        fresh.push(item);
+      }
+    }
+    return fresh;
+  }
+
+  mount(item) {
+    item.wrapper = document.createElement("div");
+    // The fade-in plays once; scrolling an item back into view shows it without animating
+    item.wrapper.className = item.shown ? "virtual-item remounted" : "virtual-item";
+    item.el = document.createElement("div");
+    item.el.className = item.className;
+    item.render(item.el);
+    item.wrapper.appendChild(item.el);
+    item.wrapper.style.transform = `translateY(${item.top}px)`;
+    this.content.appendChild(item.wrapper);
+    item.measured = false;
+    item.shown = true;
+    this.mounted.add(item);
+  }
+
+  unmount(item) {
+    item.wrapper.remove();
+    item.wrapper = null;
+    item.el = null;
+    this.mounted.delete(item);
+  }
+}
+
+const chatList = new VirtualList(document.getElementById("chat-box"));
+
 function scrollToBottom() {
-  const chatBox = document.getElementById("chat-box");
-  chatBox.scrollTo({
-    top: chatBox.scrollHeight,
-    behavior: "smooth"
-  });
+  chatList.scrollToBottom();
 }
 
-// --- Typing Effect ---
-function typeEffect(element, text, speed = 20, callback) {
-  let i = 0;
-  const cursor = '<span class="cursor">|</span>';
-  element.innerHTML = "";
-
-  function typeChar() {
-    if (i < text.length) {
-      element.innerHTML = text.slice(0, i + 1) + cursor;
-      i++;
-      scrollToBottom(); // Scroll during typing
-      setTimeout(typeChar, speed);
+// --- Streaming Render ---
+const CURSOR_HTML = '<span class="cursor">|</span>';
+
+// A bot message that grows as chunks arrive. Each completed line is parsed to HTML
+// once and appended; the unfinished line is one text node extended in place, so a
+// chunk costs work proportional to the chunk rather than to the whole message.
+class StreamingMessage {
+  constructor(list) {
+    this.list = list;
+    this.lines = [];    // parsed HTML of each completed line
+    this.pending = "";  // text of the unfinished last line
+    this.done = false;
+    this.body = null;
+    this.tail = null;
+    this.item = list.append("bot-message", el => this.render(el));
+  }
+
+  render(el) {
+    el.innerHTML = "";
+    this.body = document.createElement("div");
+    this.body.className = "stream-lines";
+    this.body.innerHTML = this.lines.join("");
+    this.tail = document.createTextNode(this.pending);
+    el.append(this.body, this.tail);
+    if (!this.done) el.insertAdjacentHTML("beforeend", CURSOR_HTML);
+  }
+
+  append(chunk) {
+    const parts = chunk.split("\n");
+    if (parts.length === 1) {
+      this.pending += chunk;
+      if (this.item.el) this.tail.appendData(chunk);
     } else {
-      element.innerHTML = text; // Final text without cursor
-      if (callback) callback();
+      const completed = [this.pending + parts[0], ...parts.slice(1, -1)].map(line => parseMarkdownToHTML(line) + "<br />");
+      this.lines.push(...completed);
+      this.pending = parts[parts.length - 1];
+      if (this.item.el) {
+        this.body.insertAdjacentHTML("beforeend", completed.join(""));
+        this.tail.nodeValue = this.pending;
+      }
     }
+    this.list.resized(this.item);
   }
 
-  typeChar();
+  finish() {
+    if (this.done) return;
+    if (this.pending) this.lines.push(parseMarkdownToHTML(this.pending));
+    this.pending = "";
+    this.done = true;
+    if (this.item.el) this.render(this.item.el);
+    this.list.resized(this.item);
+  }
 }
 
-// --- Display Functions ---
-function displayUserMessage(message) {
-  const chatBox = document.getElementById("chat-box");
+// Parses Server-Sent Events out of a fetch body and calls onEvent(event, data) for each
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+    const events = buffer.split("\n\n");
+    buffer = done ? "" : events.pop();
+
+    events.forEach(block => {
+      let event = "message";
+      const data = [];
+      block.split("\n").forEach(line => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+      });
+      if (data.length) onEvent(event, JSON.parse(data.join("\n")));
+    });
 
-  // Create a new message element for the user
-  const userMessage = document.createElement("div");
-  userMessage.className = "user-message"; // Add a class for styling
-  userMessage.innerHTML = message;
+    if (done) break;
+  }
+}
 
-  // Append the user's message to the chat box
-  chatBox.appendChild(userMessage);
+// --- Display Functions ---
+function displayUserMessage(message) {
+  // Add the user's message to the chat list
+  chatList.append("user-message", el => { el.textContent = message; });
 
   // Scroll to the bottom of the chat box
   scrollToBottom();
@@ -64,46 +274,26 @@ function displayUserMessage(message) {
 }
 
 function displayChatbotResponse(response) {
-  const chatBox = document.getElementById("chat-box");
-
-  // Clear any existing typing interval
-  if (typingInterval) {
-    clearInterval(typingInterval);
+  const botMessage = new StreamingMessage(chatList);
+  if (response) {
+    botMessage.append(response);
+    botMessage.finish();
   }
-
-  // Create a new message element for the bot
-  const botMessage = document.createElement("div");
-  botMessage.className = "bot-message"; // Add a class for styling
-  chatBox.appendChild(botMessage);
-
-  // Scroll to the bottom of the chat box
-  scrollToBottom();
-
-  // Display the response letter by letter
-  let index = 0;
-  typingInterval = setInterval(() => {
-    if (index < response.length) {
-      botMessage.innerHTML += response[index];
-      index++;
-      scrollToBottom();
-    } else {
-      clearInterval(typingInterval); // Stop the interval when all letters are displayed
-    }
-  }, 50); // Adjust the delay (in milliseconds) for the typing speed
+  return botMessage;
 }
 
 function displayOptions(options) {
-  const chatBox = document.getElementById("chat-box");
-  const optionsHTML = options.map(option => `<button onclick="handleOption('${option}')">${option}</button>`).join('');
-  chatBox.innerHTML += `<div class="message bot-message">${optionsHTML}</div>`;
-  scrollToBottom();
-
-  // Disable buttons after one is clicked
-  document.querySelectorAll(".option-button").forEach(button => {
-    button.addEventListener("click", () => {
-      document.querySelectorAll(".option-button").forEach(btn => btn.disabled = true);
+  chatList.append("message bot-message", el => {
+    el.innerHTML = options.map(option => `<button class="option-button" onclick="handleOption('${option}')">${option}</button>`).join('');
+
+    // Disable buttons after one is clicked
+    el.querySelectorAll(".option-button").forEach(button => {
+      button.addEventListener("click", () => {
+        el.querySelectorAll(".option-button").forEach(btn => btn.disabled = true);
+      });
     });
   });
+  scrollToBottom();
 }
 
 // --- Backend Communication ---
@@ -113,23 +303,30 @@ function sendToBackend(userInput, historyAccessToggle = false) {
   const thinkingIndicator = document.getElementById("thinking-indicator");
   thinkingIndicator.style.display = "block";
 
-  fetch('/search', {
+  // The answer is rendered chunk by chunk as the server streams it
+  fetch('/search/stream', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ query: userInput, historyAccess: historyAccessToggle })
   })
-    .then(response => response.json())
-    .then(data => {
-      thinkingIndicator.style.display = "none";
-
-      if (data.options) {
-        // If the backend provides options, display them to the user
-        displayChatbotResponse(data.response);
-        displayOptions(data.options);
-      } else {
-        // Otherwise, display the chatbot's response
-        displayChatbotResponse(data.response);
+    .then(async response => {
+      if (!response.ok) {
+        throw new Error(response.statusText);
       }
+
+      let botMessage = null;
+      await readEventStream(response, (event, data) => {
+        if (!botMessage) {
+          thinkingIndicator.style.display = "none";
+          botMessage = displayChatbotResponse("");
+        }
+        if (event === "done") {
+          botMessage.finish();
+        } else if (data.text) {
+          botMessage.append(data.text);
+        }
+      });
+      if (botMessage) botMessage.finish();
     })
     .catch(error => {
       thinkingIndicator.style.display = "none";
@@ -137,6 +334,61 @@ function sendToBackend(userInput, historyAccessToggle = false) {
     });
 }
 
+// --- History Streaming ---
+// Each row is its own list item, so a dump of thousands of rows only mounts the visible ones
+function appendHistoryLines(entries) {
+  entries.forEach(entry => {
+    const text = entry.error
+      ? entry.error
+      : `${entry.title} (${entry.url}) - Last visited: ${entry.last_visited} [${entry.browser}]`;
+    chatList.append("history-entry", el => { el.textContent = text; });
+  });
+}
+
+// Reads the NDJSON history stream and renders rows as each chunk arrives
+function streamHistory(userInput) {
+  displayUserMessage(userInput);
+
+  chatList.append("bot-message", el => { el.innerHTML = "<strong>Browser History:</strong>"; });
+
+  const params = new URLSearchParams({ query: userInput });
+  // Reading history needs consent first; the stream itself only checks it
+  fetch('/enable-history', { method: 'POST' })
+    .then(() => fetch(`/history/stream?${params}`))
+    .then(async response => {
+      if (!response.ok) {
+        const data = await response.json();
+        appendHistoryLines([{ error: data.error || response.statusText }]);
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let received = 0;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffer.split("\n");
+        buffer = done ? "" : lines.pop();
+
+        const entries = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+        received += entries.length;
+        appendHistoryLines(entries);
+
+        if (done) break;
+      }
+
+      if (!received) {
+        appendHistoryLines([{ error: "No matching history found." }]);
+      }
+    })
+    .catch(error => {
+      appendHistoryLines([{ error: `Error: ${error.message}` }]);
+    });
+}
+
 // --- Query Handling ---
 function isBrowserHistoryQuery(query) {
   const historyKeywords = ["browser history", "visited sites", "recent tabs", "history", "my history", "what did I visit"];
@@ -161,6 +413,10 @@ document.getElementById("search-form").addEventListener("submit", function (even
       alert("History access is disabled. Please enable it to ask history-related questions.");
       return; // Stop further execution if history access is not enabled
     }
+
+    // Stream history rows instead of waiting for one large response
+    streamHistory(userInput);
+    return;
   }
 
   // Send the user input and history access status to the backend
@@ -0,0 +1,62 @@
+"""
+Routing of questions to history analytics, browsing sessions and plain history.
+
+    python -m pytest tests/test_history_intent.py
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Routing needs no model; keep the import from configuring the real Gemini client
+os.environ.setdefault("GEMINI_FAKE_MODEL", "1")
+
+from search import history_intent, query_matcher  # noqa: E402
+from history_analytics import pick_chart  # noqa: E402
+
+
+def intent(question):
+    return history_intent(query_matcher.match(question))
+
+
+class HistoryIntentTest(unittest.TestCase):
+    def test_analytics_questions(self):
+        for question in (
+            "which sites did I spend most time on this month",
+            "visits per hour of day",
+            "top domains yesterday",
+            "how much time did I spend on youtube last week",
+            "sites per hour",
+            "what time of day am I busiest browsing",
+        ):
+            with self.subTest(question=question):
+                self.assertEqual(intent(question), "analytics")
+
+    def test_general_questions_stay_general(self):
+        for question in (
+            "how much time does it take to boil an egg",
+            "busiest airport in europe",
+            "what is the most visited museum in the world",
+            "how long is the great wall of china",
+            "I am researching quantum computing, explain qubits",
+        ):
+            with self.subTest(question=question):
+                self.assertIsNone(intent(question))
+
+    def test_sessions_questions(self):
+        for question in ("what was I researching tuesday afternoon", "what was I working on yesterday"):
+            with self.subTest(question=question):
+                self.assertEqual(intent(question), "sessions")
+
+    def test_chart_choice_matches_whole_words(self):
+        self.assertEqual(pick_chart("visits per hour of day"), "hourly")
+        self.assertEqual(pick_chart("which sites did I spend most time on"), "time")
+        self.assertEqual(pick_chart("show my browsing heatmap"), "heatmap")
+        self.assertEqual(pick_chart("top domains yesterday"), "domains")
+        # "long" inside "belong" and "when" inside "whenever" don't count
+        self.assertEqual(pick_chart("top sites that belong to news outlets"), "domains")
+        self.assertEqual(pick_chart("top domains whenever I browse"), "domains")
+
+
+if __name__ == "__main__":
+    unittest.main()
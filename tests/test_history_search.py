@@ -0,0 +1,90 @@
+"""
+Keyword history questions: full-text (BM25) and semantic rankings are fused.
+
+    python -m pytest tests/test_history_search.py
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import history_store  # noqa: E402
+from generate_history import SCHEMA  # noqa: E402
+from history_engine import HistoryEngine, HistoryEntry  # noqa: E402
+from history_sources import ChromiumSource  # noqa: E402
+
+PAGES = [
+    ("https://docs.rs/tokio/latest/tokio/", "Tokio runtime documentation"),
+    ("https://rust-lang.github.io/async-book/", "Asynchronous Programming in Rust"),
+    ("https://blog.example.com/zeitgeist-of-async-rust", "The zeitgeist of async Rust"),
+    ("https://news.example.com/python-3-13", "What's new in Python 3.13"),
+    ("https://cooking.example.com/pasta", "Fresh pasta at home"),
+]
+
+
+class RankedSearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, "History")
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        with conn:
+            for i, (url, title) in enumerate(PAGES, 1):
+                visit_time = 13_300_000_000_000_000 + i * 60_000_000
+                conn.execute(
+                    "INSERT INTO urls (id, url, title, visit_count, last_visit_time) VALUES (?, ?, ?, 1, ?)",
+                    (i, url, title, visit_time),
+                )
+                conn.execute("INSERT INTO visits (id, url, visit_time) VALUES (?, ?, ?)", (i, i, visit_time))
+        conn.close()
+
+        cls.store_dir = mock.patch.object(history_store, "HISTORY_STORE_DIR", os.path.join(cls.directory.name, "store"))
+        cls.store_dir.start()
+        cls.engine = HistoryEngine(sources=[ChromiumSource("Chrome", "RankedSearchTest", path)])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store_dir.stop()
+        for source in cls.engine.sources():
+            history_store._stores.pop(source.name, None)
+        cls.directory.cleanup()
+
+    def titles(self, entries):
+        return [entry.title for entry in entries]
+
+    def test_exact_match_ranks_first(self):
+        results = self.engine.ranked_search(["zeitgeist"])
+        self.assertEqual(results[0].title, "The zeitgeist of async Rust")
+
+    def test_similar_pages_join_exact_matches(self):
+        titles = self.titles(self.engine.ranked_search(["rust", "async"]))
+        self.assertIn("Asynchronous Programming in Rust", titles)
+        self.assertIn("The zeitgeist of async Rust", titles)
+        self.assertNotIn("Fresh pasta at home", titles)
+
+    def test_full_text_is_used_when_semantic_search_finds_something(self):
+        # A semantic hit for every question used to mean the BM25 ranking never ran
+        source = self.engine.sources()[0]
+        unrelated = HistoryEntry(source, 5, "https://cooking.example.com/pasta", "Fresh pasta at home", 1)
+        with mock.patch.object(self.engine, "semantic_search", return_value=[(unrelated, 0.9)]), \
+                mock.patch.object(self.engine, "search", wraps=self.engine.search) as search:
+            titles = self.titles(self.engine.ranked_search(["python"]))
+        search.assert_called_once()
+        self.assertEqual(titles[0], "What's new in Python 3.13")
+        self.assertIn("Fresh pasta at home", titles)
+
+    def test_full_text_alone_when_semantic_index_fails(self):
+        with mock.patch.object(self.engine, "semantic_search", side_effect=RuntimeError("index broke")):
+            titles = self.titles(self.engine.ranked_search(["tokio"]))
+        self.assertEqual(titles, ["Tokio runtime documentation"])
+
+
+if __name__ == "__main__":
+    unittest.main()
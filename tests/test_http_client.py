@@ -0,0 +1,134 @@
+"""
+Backend retries, retry budget and circuit breaker against a stub HTTP server.
+
+    python -m pytest tests/test_http_client.py
+"""
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import Backend, CircuitOpenError  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Statuses to answer with, in order; the last one repeats
+    statuses = [200]
+    hits = 0
+
+    def do_GET(self):
+        cls = type(self)
+        status = cls.statuses[min(cls.hits, len(cls.statuses) - 1)]
+        cls.hits += 1
+        if status == 302:
+            # Redirects to itself forever: requests gives up with TooManyRedirects
+            self.send_response(302)
+            self.send_header("Location", self.path)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BackendTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def backend(self, statuses, **kwargs):
+        StubHandler.statuses, StubHandler.hits = statuses, 0
+        backend = Backend("stub", self.url, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_retries_retryable_status(self):
+        backend = self.backend([503, 502, 200], max_retries=2)
+        response = backend.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubHandler.hits, 3)
+        self.assertEqual(backend.breaker.state, "closed")
+
+    def test_gives_up_after_max_retries(self):
+        backend = self.backend([503], max_retries=1)
+        with self.assertRaises(requests.HTTPError):
+            backend.get()
+        self.assertEqual(StubHandler.hits, 2)
+
+    def test_client_errors_are_not_retried(self):
+        backend = self.backend([404, 200])
+        self.assertEqual(backend.get().status_code, 404)
+        self.assertEqual(StubHandler.hits, 1)
+
+    def test_retry_budget_caps_retries(self):
+        backend = self.backend([503], max_retries=5)
+        backend.budget.min_retries = 0
+        backend.budget.ratio = 0
+        with self.assertRaises(requests.HTTPError):
+            backend.get()
+        self.assertEqual(StubHandler.hits, 1)
+
+    def test_breaker_opens_and_fails_fast(self):
+        backend = self.backend([500], max_retries=0)
+        backend.breaker.threshold = 2
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                backend.get()
+        self.assertEqual(backend.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            backend.get()
+        self.assertEqual(StubHandler.hits, 2)
+
+    def test_half_open_trial_closes_on_success(self):
+        backend = self.backend([500, 200], max_retries=0)
+        backend.breaker.threshold = 1
+        backend.breaker.cooldown = 0
+        with self.assertRaises(requests.HTTPError):
+            backend.get()
+        self.assertEqual(backend.breaker.state, "half-open")
+        self.assertEqual(backend.get().status_code, 200)
+        self.assertEqual(backend.breaker.state, "closed")
+
+    def test_unexpected_error_ends_half_open_trial(self):
+        backend = self.backend([500, 302], max_retries=0)
+        backend.breaker.threshold = 1
+        backend.breaker.cooldown = 0
+        with self.assertRaises(requests.HTTPError):
+            backend.get()
+        # The trial fails with an error the retry loop doesn't handle
+        with self.assertRaises(requests.TooManyRedirects):
+            backend.get()
+        # It still counts as a failure, so the next trial is let through
+        StubHandler.statuses, StubHandler.hits = [200], 0
+        self.assertEqual(backend.get().status_code, 200)
+        self.assertEqual(backend.breaker.state, "closed")
+
+    def test_deadline_counts_as_failure(self):
+        backend = self.backend([200])
+        backend.breaker.threshold = 1
+        with self.assertRaises(requests.Timeout):
+            backend.get(deadline=0)
+        self.assertEqual(backend.breaker.state, "open")
+
+
+if __name__ == "__main__":
+    unittest.main()